@@ -2,18 +2,27 @@ import eventlet
 
 eventlet.monkey_patch()  # MUST BE FIRST LINE
 
+# psycopg2 talks to libpq in C; without a wait callback every query would
+# block the eventlet hub and every other green connection with it
+from psycogreen.eventlet import patch_psycopg
+
+patch_psycopg()
+
+import atexit
 import logging
 import os
 import time
 from datetime import datetime, timedelta
-from flask import Flask, jsonify, g
+from flask import Flask, jsonify
 from flask_cors import CORS
 from flask_socketio import SocketIO
 
 from config import Config
+from utils import OrjsonProvider, ORJSON_AVAILABLE
 from services import (
     DatabaseService,
     MikroTikManager,
+    MikroTikSnapshot,
     VoucherService,
     MonitoringService,
     AuthService,
@@ -44,6 +53,7 @@ def _initialize_routes(
     voucher_service,
     auth_service,
     subscription_service,
+    mikrotik_snapshot,
 ):
     """Initialize all application routes"""
 
@@ -95,10 +105,10 @@ def _initialize_routes(
 
     # Initialize all route modules
     init_vouchers_routes(app, voucher_service)
-    init_profiles_routes(app, database_service, mikrotik_manager)
+    init_profiles_routes(app, database_service, mikrotik_manager, mikrotik_snapshot)
     init_users_routes(app, database_service, mikrotik_manager)
     init_financial_routes(app, database_service, mikrotik_manager)
-    init_system_routes(app, mikrotik_manager)
+    init_system_routes(app, mikrotik_snapshot)
     init_pricing_routes(app, database_service)
     init_auth_routes(
         app, database_service, mikrotik_manager, auth_service, subscription_service
@@ -110,6 +120,10 @@ def create_app():
 
     app = Flask(__name__)
 
+    # Parse request bodies and encode jsonify() output with orjson
+    if ORJSON_AVAILABLE:
+        app.json = OrjsonProvider(app)
+
     # Load configuration
     config = Config()
 
@@ -134,6 +148,7 @@ def create_app():
 
     logger.info("Initializing MikroTik manager...")
     mikrotik_manager = MikroTikManager(config)
+    mikrotik_snapshot = MikroTikSnapshot(mikrotik_manager)
 
     logger.info("Initializing voucher service...")
     voucher_service = VoucherService(config, database_service, mikrotik_manager)
@@ -165,12 +180,18 @@ def create_app():
         voucher_service,
         auth_service,
         subscription_service,
+        mikrotik_snapshot,
     )
 
-    # Initialize middleware
-    @app.before_request
-    def before_request():
-        g.database_service = database_service
+    # Poll shared router views in the background
+    mikrotik_snapshot.start()
+
+    # Close router sessions left idle in the pool, and all of them on exit
+    mikrotik_manager.start_idle_sweeper()
+    atexit.register(mikrotik_manager.close)
+
+    # Remove old generated PDFs periodically instead of on request
+    voucher_service.start_pdf_cleanup()
 
     # Start monitoring service
     logger.info("Starting monitoring service...")
@@ -183,6 +204,7 @@ def create_app():
     # Store services in app config
     app.config["database_service"] = database_service
     app.config["mikrotik_manager"] = mikrotik_manager
+    app.config["mikrotik_snapshot"] = mikrotik_snapshot
     app.config["voucher_service"] = voucher_service
     app.config["monitoring_service"] = monitoring_service
     app.config["auth_service"] = auth_service
@@ -202,4 +224,6 @@ if __name__ == "__main__":
     debug = config.FLASK_DEBUG
 
     logger.info(f"Starting server on {host}:{port} (debug: {debug})")
-    socketio.run(app, host=host, port=port, debug=debug)
+    # socketio.run serves through eventlet's WSGI server; the Werkzeug
+    # reloader is only enabled together with debug in development.
+    socketio.run(app, host=host, port=port, debug=debug, use_reloader=debug)
@@ -1040,18 +1040,14 @@ def get_revenue_data():
     )
     
     # Generate data for all days, even if no transactions
+    row_map = {row['date'].isoformat(): row for row in rows}
+    today = datetime.now().date()
     data = []
     for i in range(days):
-        date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
-        revenue = 0
-        voucher_count = 0
-        
-        for row in rows:
-            if row['date'].strftime('%Y-%m-%d') == date:
-                revenue = row['revenue']
-                voucher_count = row['voucher_count']
-                break
-                
+        date = (today - timedelta(days=i)).isoformat()
+        row = row_map.get(date)
+        revenue = row['revenue'] if row else 0
+        voucher_count = row['voucher_count'] if row else 0
         data.append({'date': date, 'revenue': revenue, 'voucher_count': voucher_count})
     
     data.reverse()  # Sort chronologically
@@ -1264,6 +1260,8 @@ def update_user_comment(username):
 if __name__ == "__main__":
     host = os.getenv('FLASK_HOST', '0.0.0.0')
     port = int(os.getenv('FLASK_PORT', 5000))
-    debug = os.getenv('FLASK_DEBUG', 'True').lower() == 'true'
+    debug = os.getenv(
+        'FLASK_DEBUG', 'True' if os.getenv('FLASK_ENV') == 'development' else 'False'
+    ).lower() == 'true'
     
-    socketio.run(app, host=host, port=port, debug=debug)
\ No newline at end of file
+    socketio.run(app, host=host, port=port, debug=debug, use_reloader=debug)
\ No newline at end of file
@@ -2,13 +2,16 @@
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
-from datetime import datetime, timedelta
+from datetime import datetime
 import sqlite3
 import routeros_api
 import threading
 import time
 import logging
 import json
+import os
+import secrets
+import string
 import eventlet
 eventlet.monkey_patch()
 
@@ -30,6 +33,14 @@ socketio = SocketIO(app,
                    engineio_logger=True)
 
 DB_PATH = "vouchers.db"
+VOUCHER_CODE_CHARS = string.ascii_uppercase + string.digits
+VOUCHER_CODE_LENGTH = 8
+
+def get_db():
+    """Open a SQLite connection whose rows support access by column name"""
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    return conn
 
 @app.after_request
 def after_request(response):
@@ -246,6 +257,22 @@ def init_db():
         )
     ''')
     
+    # One SALE per voucher: the monitor re-reports online vouchers every tick.
+    # Collapse duplicates left by older versions before adding the index.
+    # Sales without a voucher code are distinct rows, not duplicates.
+    c.execute('''
+        DELETE FROM financial_transactions
+        WHERE transaction_type = 'SALE' AND voucher_code IS NOT NULL AND id NOT IN (
+            SELECT MIN(id) FROM financial_transactions
+            WHERE transaction_type = 'SALE' AND voucher_code IS NOT NULL
+            GROUP BY voucher_code
+        )
+    ''')
+    c.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_ft_sale
+        ON financial_transactions(voucher_code) WHERE transaction_type = 'SALE'
+    ''')
+    
     # Initialize default pricing rates
     default_rates = [('day', 1000), ('week', 6000), ('month', 25000)]
     for rate_type, amount in default_rates:
@@ -257,29 +284,33 @@ def init_db():
     conn.commit()
     conn.close()
 
+# Profile defaults keyed by name fragments, checked in order
+PROFILE_PRICE_TABLE = [
+    (("1day", "daily"), dict(price=1000, time_limit="24h", validity_period=24, uptime_limit="24h")),
+    (("1week", "weekly"), dict(price=6000, time_limit="7 days", validity_period=168, uptime_limit="168h")),
+    (("1month", "monthly"), dict(price=25000, time_limit="30 days", validity_period=720, uptime_limit="720h")),
+]
+DEFAULT_PROFILE_PRICING = dict(price=0, time_limit="24h", validity_period=24, uptime_limit="24h")
+
+def classify_profile(name):
+    """Return pricing defaults for a profile name"""
+    name = (name or '').lower()
+    for keys, pricing in PROFILE_PRICE_TABLE:
+        if any(key in name for key in keys):
+            return pricing
+    return DEFAULT_PROFILE_PRICING
+
 def add_profile_to_db(profile):
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     
     # Calculate price based on profile name or other criteria
-    price = 0
-    time_limit = "24h"
+    pricing = classify_profile(profile.get('name'))
+    price = pricing['price']
+    time_limit = pricing['time_limit']
     data_limit = "Unlimited"
-    validity_period = 24
-    uptime_limit = "24h"
-    
-    if "1day" in profile.get('name', '').lower() or "daily" in profile.get('name', '').lower():
-        price = 1000
-    elif "1week" in profile.get('name', '').lower() or "weekly" in profile.get('name', '').lower():
-        price = 6000
-        time_limit = "7 days"
-        validity_period = 168
-        uptime_limit = "168h"
-    elif "1month" in profile.get('name', '').lower() or "monthly" in profile.get('name', '').lower():
-        price = 25000
-        time_limit = "30 days"
-        validity_period = 720
-        uptime_limit = "720h"
+    validity_period = pricing['validity_period']
+    uptime_limit = pricing['uptime_limit']
     
     c.execute('''
         INSERT OR REPLACE INTO bandwidth_profiles 
@@ -297,24 +328,60 @@ def add_profile_to_db(profile):
     ))
     conn.commit()
     conn.close()
+    invalidate_profile_cache(profile.get('name'))
+
+# Memoized bandwidth_profiles rows: {name: (row, cached_at)}
+_profile_cache = {}
+_profile_cache_lock = threading.Lock()
+PROFILE_CACHE_TTL = 300
+
+def get_profile_row(profile_name):
+    """Return the bandwidth profile as a dict, served from cache when fresh"""
+    now = time.time()
+    with _profile_cache_lock:
+        cached = _profile_cache.get(profile_name)
+        if cached and now - cached[1] < PROFILE_CACHE_TTL:
+            return cached[0]
+
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('''
+        SELECT name, rate_limit, price, time_limit, data_limit, validity_period, uptime_limit
+        FROM bandwidth_profiles WHERE name=?
+    ''', (profile_name,))
+    row = c.fetchone()
+    conn.close()
+
+    if not row:
+        return None
+
+    profile = dict(row)
+    with _profile_cache_lock:
+        _profile_cache[profile_name] = (profile, now)
+    return profile
+
+def invalidate_profile_cache(profile_name=None):
+    """Drop one cached profile, or all of them"""
+    with _profile_cache_lock:
+        if profile_name is None:
+            _profile_cache.clear()
+        else:
+            _profile_cache.pop(profile_name, None)
 
 def add_voucher_to_db(voucher_code, profile_name, password="", password_type="blank", customer_name="", customer_contact=""):
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     
-    # Calculate expiry time based on profile
-    c.execute('SELECT validity_period FROM bandwidth_profiles WHERE name=?', (profile_name,))
-    profile = c.fetchone()
-    expiry_time = None
-    
-    if profile and profile[0]:
-        expiry_hours = profile[0]
-        expiry_time = datetime.now() + timedelta(hours=expiry_hours)
-    
+    # Expiry is derived from the profile's validity period in the same statement;
+    # the scalar subquery yields NULL when the profile is unknown
     c.execute('''
         INSERT INTO vouchers (voucher_code, profile_name, password, password_type, customer_name, customer_contact, expiry_time)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (voucher_code, profile_name, password, password_type, customer_name, customer_contact, expiry_time))
+        VALUES (?, ?, ?, ?, ?, ?, (
+            SELECT datetime('now', printf('+%d hours', validity_period))
+            FROM bandwidth_profiles
+            WHERE name=? AND validity_period > 0
+        ))
+    ''', (voucher_code, profile_name, password, password_type, customer_name, customer_contact, profile_name))
     conn.commit()
     conn.close()
 
@@ -331,7 +398,7 @@ def add_transaction(voucher_code, amount, transaction_type="SALE"):
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     c.execute('''
-        INSERT INTO financial_transactions (voucher_code, amount, transaction_type)
+        INSERT OR IGNORE INTO financial_transactions (voucher_code, amount, transaction_type)
         VALUES (?, ?, ?)
     ''', (voucher_code, amount, transaction_type))
     conn.commit()
@@ -363,7 +430,7 @@ def update_pricing_rates(rates):
     conn.close()
 
 def get_expired_vouchers():
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_db()
     c = conn.cursor()
     c.execute('''
         SELECT voucher_code, profile_name, activated_at, expiry_time, is_expired
@@ -372,19 +439,12 @@ def get_expired_vouchers():
         ORDER BY activated_at DESC
         LIMIT 50
     ''')
-    rows = c.fetchall()
+    # Iterate the cursor directly; no intermediate fetchall() list
+    expired_vouchers = [
+        dict(row, is_expired=bool(row['is_expired'])) for row in c
+    ]
     conn.close()
     
-    expired_vouchers = []
-    for row in rows:
-        expired_vouchers.append({
-            'voucher_code': row[0],
-            'profile_name': row[1],
-            'activated_at': row[2],
-            'expiry_time': row[3],
-            'is_expired': bool(row[4])
-        })
-    
     return expired_vouchers
 
 def get_all_users():
@@ -521,11 +581,11 @@ def update_user_comment(username, comment):
 
 def get_voucher_details(voucher_code):
     """Get detailed voucher information"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_db()
     c = conn.cursor()
     
     c.execute('''
-        SELECT v.voucher_code, v.profile_name, v.created_at, v.activated_at, 
+        SELECT v.voucher_code AS code, v.profile_name, v.created_at, v.activated_at, 
                v.is_used, v.bytes_used, v.customer_name, v.customer_contact,
                v.password_type, v.password, p.price, p.uptime_limit
         FROM vouchers v
@@ -539,20 +599,7 @@ def get_voucher_details(voucher_code):
     if not row:
         return None
     
-    return {
-        'code': row[0],
-        'profile_name': row[1],
-        'created_at': row[2],
-        'activated_at': row[3],
-        'is_used': bool(row[4]),
-        'bytes_used': row[5],
-        'customer_name': row[6],
-        'customer_contact': row[7],
-        'password_type': row[8],
-        'password': row[9],
-        'price': row[10],
-        'uptime_limit': row[11]
-    }
+    return dict(row, is_used=bool(row['is_used']))
 
 # ----------------------------
 # Global MikroTik Manager
@@ -597,63 +644,92 @@ def handle_request_update(data):
 # ----------------------------
 # Background Monitoring Thread
 # ----------------------------
+MONITOR_ACTIVE_INTERVAL = 10   # seconds between polls while users are online
+MONITOR_IDLE_INTERVAL = 30     # first back-off step once nobody is online
+MONITOR_MAX_INTERVAL = 300     # upper bound for idle back-off
+MONITOR_IDLE_TICKS = 3         # idle polls before backing off
+
+def next_monitor_interval(active_count, idle_ticks, current_interval):
+    """Return (idle_ticks, interval) for the next monitor poll"""
+    if active_count > 0:
+        return 0, MONITOR_ACTIVE_INTERVAL
+    idle_ticks += 1
+    if idle_ticks < MONITOR_IDLE_TICKS:
+        return idle_ticks, MONITOR_IDLE_INTERVAL
+    return idle_ticks, min(max(current_interval, MONITOR_IDLE_INTERVAL) * 2, MONITOR_MAX_INTERVAL)
+
 def monitor_active_users():
+    idle_ticks = 0
+    interval = MONITOR_IDLE_INTERVAL
+    last_active_count = 0
+    system_info = None
+    revenue_data = []
     while True:
         try:
             active_users = mikrotik_manager.get_active_users()
-            
-            # Update active users cache
-            conn = sqlite3.connect(DB_PATH)
-            c = conn.cursor()
-            c.execute('DELETE FROM ip_hotspot_active_cache')
-            for user in active_users:
-                c.execute('''
-                    INSERT INTO ip_hotspot_active_cache (user, uptime, server, bytes_in, bytes_out)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (
-                    user.get('user'), 
-                    user.get('uptime'), 
-                    user.get('server'),
-                    user.get('bytes-in', 0),
-                    user.get('bytes-out', 0)
-                ))
-            conn.commit()
-            conn.close()
-            
-            # Update voucher usage
-            for user in active_users:
-                username = user.get('user', '')
-                if username.startswith("VOUCHER"):
-                    mark_voucher_used(username)
-                    usage = mikrotik_manager.get_user_usage(username)
-                    if usage:
-                        bytes_used = usage['bytes_in'] + usage['bytes_out']
-                        conn = sqlite3.connect(DB_PATH)
-                        c = conn.cursor()
-                        c.execute('UPDATE vouchers SET bytes_used=? WHERE voucher_code=?',
-                                  (bytes_used, username))
-                        conn.commit()
-                        conn.close()
-                        price = calculate_price(usage['uptime'])
-                        add_transaction(username, price)
+            last_active_count = len(active_users)
+
+            # Nothing online and nothing was online last time: skip the cache
+            # and usage DB work, but still expire vouchers and broadcast
+            idle = not active_users and idle_ticks >= MONITOR_IDLE_TICKS
+
+            if not idle:
+                # Update active users cache
+                conn = sqlite3.connect(DB_PATH)
+                c = conn.cursor()
+                c.execute('DELETE FROM ip_hotspot_active_cache')
+                for user in active_users:
+                    c.execute('''
+                        INSERT INTO ip_hotspot_active_cache (user, uptime, server, bytes_in, bytes_out)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', (
+                        user.get('user'), 
+                        user.get('uptime'), 
+                        user.get('server'),
+                        user.get('bytes-in', 0),
+                        user.get('bytes-out', 0)
+                    ))
+                conn.commit()
+                conn.close()
+                
+                # Update voucher usage
+                for user in active_users:
+                    username = user.get('user', '')
+                    if username.startswith("VOUCHER"):
+                        mark_voucher_used(username)
+                        usage = mikrotik_manager.get_user_usage(username)
+                        if usage:
+                            bytes_used = usage['bytes_in'] + usage['bytes_out']
+                            conn = sqlite3.connect(DB_PATH)
+                            c = conn.cursor()
+                            c.execute('UPDATE vouchers SET bytes_used=? WHERE voucher_code=?',
+                                      (bytes_used, username))
+                            conn.commit()
+                            conn.close()
+                            price = calculate_price(usage['uptime'])
+                            add_transaction(username, price)
             
             # Check for expired vouchers
             check_expired_vouchers()
             
-            # Broadcast live data to all connected clients
+            # Broadcast live data to all connected clients; idle ticks reuse
+            # the last router info and revenue series instead of refetching
             financial_stats = get_financial_stats()
-            system_info = mikrotik_manager.get_system_info()
+            if not idle or system_info is None:
+                system_info = mikrotik_manager.get_system_info()
+                revenue_data = get_revenue_data().get('revenue_data', [])
             
             socketio.emit('live_data', {
                 'financial': financial_stats,
-                'revenue': get_revenue_data().get('revenue_data', []),
+                'revenue': revenue_data,
                 'active_users': active_users,
                 'system_info': system_info
             })
             
         except Exception as e:
             logger.error(f"Error in monitor_active_users: {e}")
-        time.sleep(30)
+        idle_ticks, interval = next_monitor_interval(last_active_count, idle_ticks, interval)
+        time.sleep(interval)
 
 def check_expired_vouchers():
     """Mark vouchers as expired based on expiry time"""
@@ -747,7 +823,7 @@ def get_financial_stats():
 @app.route("/financial/revenue-data")
 def get_revenue_data():
     days = int(request.args.get("days", 30))
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_db()
     c = conn.cursor()
     c.execute('''
         SELECT DATE(transaction_date) as date, SUM(amount) as revenue, COUNT(*) as voucher_count
@@ -756,14 +832,13 @@ def get_revenue_data():
         GROUP BY DATE(transaction_date)
         ORDER BY date
     ''', (f'-{days} days',))
-    rows = c.fetchall()
+    data = [dict(r) for r in c]
     conn.close()
-    data = [{'date': r[0], 'revenue': r[1], 'voucher_count': r[2]} for r in rows]
     return jsonify({"revenue_data": data})
 
 @app.route("/financial/profile-stats")
 def get_profile_stats():
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_db()
     c = conn.cursor()
     c.execute('''
         SELECT v.profile_name,
@@ -774,18 +849,11 @@ def get_profile_stats():
         LEFT JOIN financial_transactions ft ON v.voucher_code = ft.voucher_code
         GROUP BY v.profile_name
     ''')
-    rows = c.fetchall()
+    profile_stats = [
+        dict(row, total_revenue=row['total_revenue'] or 0) for row in c
+    ]
     conn.close()
 
-    profile_stats = []
-    for row in rows:
-        profile_stats.append({
-            'profile_name': row[0],
-            'total_sold': row[1],
-            'total_revenue': row[2] or 0,
-            'used_count': row[3]
-        })
-
     return jsonify({"profile_stats": profile_stats})
 
 # Voucher endpoints
@@ -801,12 +869,8 @@ def generate_vouchers():
     if not profile_name:
         return jsonify({"error": "profile_name is required"}), 400
 
-    # Verify profile exists
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT * FROM bandwidth_profiles WHERE name=?", (profile_name,))
-    db_profile = c.fetchone()
-    conn.close()
+    # Verify profile exists; MikroTik is only consulted on a cold cache/DB miss
+    db_profile = get_profile_row(profile_name)
 
     if not db_profile:
         profiles = mikrotik_manager.get_profiles()
@@ -814,13 +878,20 @@ def generate_vouchers():
         if not profile:
             return jsonify({"error": "Profile not found on MikroTik"}), 404
         add_profile_to_db(profile)
+        db_profile = get_profile_row(profile_name)
+
+    unit_price = db_profile['price'] if db_profile else 0
 
     vouchers = []
     total_price = 0
     
-    for i in range(quantity):
-        voucher_code = f"VOUCHER{datetime.now().strftime('%Y%m%d%H%M%S')}{i}"
-        
+    # Codes keep the VOUCHER prefix the monitor relies on; the suffix comes
+    # from a CSPRNG so codes are neither guessable nor clock-dependent
+    codes = set()
+    while len(codes) < quantity:
+        codes.add("VOUCHER" + "".join(secrets.choice(VOUCHER_CODE_CHARS) for _ in range(VOUCHER_CODE_LENGTH)))
+    
+    for voucher_code in codes:
         # Determine password based on type
         password = ""
         if password_type == "same":
@@ -828,7 +899,7 @@ def generate_vouchers():
         elif password_type == "blank":
             password = ""
         else:
-            password = f"pass{datetime.now().strftime('%H%M%S')}{i}"
+            password = f"pass{secrets.token_hex(3)}"
         
         # Add to database
         add_voucher_to_db(voucher_code, profile_name, password, password_type, customer_name, customer_contact)
@@ -843,14 +914,7 @@ def generate_vouchers():
         })
         
         # Calculate price for this voucher
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT price FROM bandwidth_profiles WHERE name=?", (profile_name,))
-        price_row = c.fetchone()
-        conn.close()
-        
-        if price_row:
-            total_price += price_row[0]
+        total_price += unit_price or 0
 
     # Broadcast voucher generation event
     socketio.emit('vouchers_generated', {
@@ -971,4 +1035,5 @@ def handle_pricing_rates():
 # ----------------------------
 if __name__ == "__main__":
     logger.info("Starting MikroTik Voucher Tracker API with Socket.IO support")
-    socketio.run(app, host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
+    debug = os.getenv('FLASK_ENV') == 'development'
+    socketio.run(app, host="0.0.0.0", port=5000, debug=debug, use_reloader=debug)
\ No newline at end of file
@@ -23,7 +23,11 @@ class Config:
     # Flask configuration
     FLASK_HOST = os.getenv('FLASK_HOST', '0.0.0.0')
     FLASK_PORT = int(os.getenv('FLASK_PORT', 5000))
-    FLASK_DEBUG = os.getenv('FLASK_DEBUG', 'True').lower() == 'true'
+    FLASK_ENV = os.getenv('FLASK_ENV', 'production')
+    # Debug/reloader only in development: it serializes requests under eventlet
+    FLASK_DEBUG = os.getenv(
+        'FLASK_DEBUG', 'True' if FLASK_ENV == 'development' else 'False'
+    ).lower() == 'true'
     
     # CORS configuration
     CORS_ORIGINS = os.getenv('CORS_ORIGINS', 'http://localhost:5173,http://localhost:3000').split(',')
@@ -1,31 +1,316 @@
 import psycopg2
-from psycopg2.extras import RealDictCursor, execute_batch
+from psycopg2.extras import RealDictCursor, NamedTupleCursor, execute_batch, execute_values
+from psycopg2.pool import ThreadedConnectionPool
 import logging
 from typing import List, Dict, Any, Optional, Tuple
 import threading
-from datetime import datetime, timedelta
+from datetime import datetime
 from contextlib import contextmanager
+from collections import OrderedDict
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import time
 import os
 import random
+import numpy as np
 import json
-import subprocess
-from cryptography.fernet import Fernet
-import base64
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 import re
+from cachetools import TTLCache
+import select
 
 logger = logging.getLogger(__name__)
 
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# Cache prefixes that go stale when a table is written through execute_query
+_WRITE_INVALIDATION_PREFIXES = {
+    "subscription_packages": ("package_", "subscription_", "router_access_"),
+    "enhanced_user_routers": ("user_routers_", "router_access_"),
+}
+_WRITE_TARGET_RE = re.compile(r"\b(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+(\w+)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=256)
+def _invalidation_prefixes(query: str) -> Tuple[str, ...]:
+    """Cache prefixes to drop after running query (memoized per SQL text)"""
+    prefixes = []
+    for table in _WRITE_TARGET_RE.findall(query):
+        for prefix in _WRITE_INVALIDATION_PREFIXES.get(table.lower(), ()):
+            if prefix not in prefixes:
+                prefixes.append(prefix)
+    return tuple(prefixes)
+
+
+# Hot lookups prepared once per pooled connection (name -> statement)
+PREPARED_STATEMENTS = {
+    "ps_voucher_by_code": "PREPARE ps_voucher_by_code(text) AS SELECT * FROM vouchers WHERE voucher_code = $1",
+    "ps_user_by_email": "PREPARE ps_user_by_email(text) AS SELECT * FROM users WHERE LOWER(email) = LOWER($1)",
+    "ps_user_by_id": "PREPARE ps_user_by_id(text) AS SELECT * FROM users WHERE user_id = $1",
+    # features come back as text together with the package row's xmin, so
+    # callers only parse them when the package has changed since the last parse
+    "ps_active_subscription": """
+        PREPARE ps_active_subscription(integer) AS
+        SELECT us.*, sp.id AS package_id, sp.xmin::text AS row_version,
+               sp.features::text AS features, sp.price,
+               EXTRACT(DAYS FROM (us.end_date - CURRENT_TIMESTAMP)) as days_remaining
+        FROM user_subscriptions us
+        JOIN subscription_packages sp ON us.package_type = sp.package_name
+        WHERE us.user_id = $1 AND us.is_active = TRUE AND us.end_date > CURRENT_TIMESTAMP
+        ORDER BY us.end_date DESC
+        LIMIT 1
+    """,
+    # User flag, router count and the ps_active_subscription row in one round
+    # trip; the subscription columns are NULL when there is none
+    "ps_router_access": """
+        PREPARE ps_router_access(text) AS
+        WITH u AS (
+            SELECT id, is_active FROM users WHERE user_id = $1
+        ), s AS (
+            SELECT us.*, sp.id AS package_id, sp.xmin::text AS row_version,
+                   sp.features::text AS features, sp.price,
+                   EXTRACT(DAYS FROM (us.end_date - CURRENT_TIMESTAMP)) AS days_remaining
+            FROM user_subscriptions us
+            JOIN subscription_packages sp ON us.package_type = sp.package_name
+            WHERE us.user_id = (SELECT id FROM u)
+              AND us.is_active = TRUE AND us.end_date > CURRENT_TIMESTAMP
+            ORDER BY us.end_date DESC
+            LIMIT 1
+        ), r AS (
+            SELECT COUNT(*) AS router_count FROM enhanced_user_routers
+            WHERE user_id = (SELECT id FROM u) AND is_active = TRUE
+        )
+        SELECT u.is_active AS user_active, r.router_count, s.*
+        FROM u CROSS JOIN r LEFT JOIN s ON TRUE
+    """,
+}
+
+
+# SQL used by the services, built once at import time
+_SQL_EXECUTE_VOUCHER_BY_CODE = "EXECUTE ps_voucher_by_code(%s)"
+_SQL_EXECUTE_USER_BY_EMAIL = "EXECUTE ps_user_by_email(%s)"
+_SQL_EXECUTE_USER_BY_ID = "EXECUTE ps_user_by_id(%s)"
+_SQL_GET_USER_DB_ID = "SELECT id FROM users WHERE user_id=%s"
+_SQL_INSERT_VOUCHER = """
+    INSERT INTO vouchers (voucher_code, profile_name, customer_name, customer_contact,
+        expiry_time, uptime_limit, password_type)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+# No arbiter on ON CONFLICT: any unique hit -- email, or LOWER(email) via
+# idx_users_email_lower -- skips the insert atomically. A SELECT-then-INSERT
+# probe would let two concurrent sign-ups with the same address both pass.
+_SQL_REGISTER_USER = """
+    WITH new_user AS (
+        INSERT INTO users (user_id, email, password, full_name, phone, company_name, role, is_verified)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT DO NOTHING
+        RETURNING id, user_id
+    ), activity AS (
+        INSERT INTO user_activity (user_id, action_type, description)
+        SELECT id, 'REGISTRATION', 'User registered successfully' FROM new_user
+    )
+    SELECT id, user_id FROM new_user
+"""
+# Locks the voucher, resolves its package, claims it, activates the user and
+# creates the subscription in one statement. The final row reports why
+# nothing was written (no voucher, no user, already used, unknown package).
+_SQL_ACTIVATE_SUBSCRIPTION = """
+    WITH v AS (
+        SELECT voucher_code, is_used,
+               CASE
+                   WHEN POSITION('professional' IN LOWER(COALESCE(profile_name, 'Basic'))) > 0 THEN 'Professional'
+                   WHEN POSITION('premium' IN LOWER(COALESCE(profile_name, 'Basic'))) > 0 THEN 'Premium'
+                   ELSE 'Basic'
+               END AS package_type
+        FROM vouchers
+        WHERE voucher_code = %s
+        FOR UPDATE
+    ), pkg AS (
+        SELECT v.voucher_code, v.is_used, v.package_type, sp.router_limit
+        FROM v
+        LEFT JOIN subscription_packages sp
+               ON sp.package_name = v.package_type AND sp.is_active = TRUE
+    ), u AS (
+        SELECT id FROM users WHERE user_id = %s
+    ), claim AS (
+        SELECT pkg.voucher_code, pkg.package_type, pkg.router_limit, u.id AS user_db_id
+        FROM pkg, u
+        WHERE COALESCE(pkg.is_used, FALSE) = FALSE AND pkg.router_limit IS NOT NULL
+    ), upd_voucher AS (
+        UPDATE vouchers SET is_used = TRUE, activated_at = NOW()
+        FROM claim
+        WHERE vouchers.voucher_code = claim.voucher_code
+        RETURNING vouchers.voucher_code
+    ), upd_user AS (
+        UPDATE users SET is_verified = TRUE, is_active = TRUE
+        FROM claim
+        WHERE users.id = claim.user_db_id
+        RETURNING users.id
+    ), sub AS (
+        INSERT INTO user_subscriptions
+        (user_id, voucher_code, package_type, router_limit, start_date, end_date, is_active)
+        SELECT user_db_id, voucher_code, package_type, router_limit,
+               NOW(), NOW() + make_interval(days => %s), TRUE
+        FROM claim
+        RETURNING id, start_date, end_date
+    )
+    SELECT pkg.is_used, pkg.package_type, pkg.router_limit,
+           (SELECT id FROM u) AS user_db_id,
+           sub.id AS subscription_id, sub.start_date, sub.end_date
+    FROM pkg
+    LEFT JOIN sub ON TRUE
+"""
+_SQL_ACTIVE_PACKAGES = """
+    SELECT id, package_name, router_limit, price, features, is_active, created_at
+    FROM subscription_packages
+    WHERE is_active = TRUE
+"""
+_SQL_GET_ACTIVE_SUBSCRIPTION = "EXECUTE ps_active_subscription(%s)"
+_SQL_ROUTER_ACCESS = "EXECUTE ps_router_access(%s)"
+# Inserts the router with its WireGuard interface and logs the activity in
+# one statement. The id is drawn up front because sibling CTEs share a
+# snapshot, so an UPDATE could not see the row the INSERT creates.
+_SQL_INSERT_ROUTER = """
+    WITH rid AS (
+        SELECT nextval(pg_get_serial_sequence('enhanced_user_routers', 'id')) AS id
+    ), new_router AS (
+        INSERT INTO enhanced_user_routers
+        (id, user_id, router_name, host, username, password, model, location,
+         wireguard_public_key, wireguard_private_key, description,
+         wireguard_interface, wireguard_port, is_wireguard_setup)
+        SELECT rid.id, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+               'wg-' || rid.id, %s, TRUE
+        FROM rid
+        RETURNING id, user_id
+    ), activity AS (
+        INSERT INTO user_activity (user_id, action_type, description)
+        SELECT user_id, 'ROUTER_ADD', %s FROM new_router
+    )
+    SELECT id FROM new_router
+"""
+_WIREGUARD_PORT = 51820
+_USER_ROUTER_COLUMNS = (
+    'id', 'router_name', 'host', 'model', 'location', 'is_online', 'last_seen',
+    'is_wireguard_setup', 'created_at'
+)
+_SQL_GET_USER_ROUTERS = f"""
+    SELECT {', '.join(_USER_ROUTER_COLUMNS)}
+    FROM enhanced_user_routers
+    WHERE user_id = %s AND is_active = TRUE
+    ORDER BY created_at DESC
+"""
+_SQL_EXPIRING_SUBSCRIPTIONS = """
+    SELECT u.full_name,
+           EXTRACT(DAY FROM (us.end_date - CURRENT_TIMESTAMP))::int AS days_remaining
+    FROM user_subscriptions us
+    JOIN users u ON us.user_id = u.id
+    WHERE us.is_active = TRUE
+    AND us.end_date BETWEEN CURRENT_TIMESTAMP AND CURRENT_TIMESTAMP + INTERVAL '3 days'
+    AND u.is_active = TRUE
+"""
+# Seconds until the next active subscription enters the 3-day expiry window
+_SQL_NEXT_EXPIRY_WINDOW = """
+    SELECT EXTRACT(EPOCH FROM (MIN(end_date) - INTERVAL '3 days' - CURRENT_TIMESTAMP))
+    FROM user_subscriptions
+    WHERE is_active = TRUE AND end_date > CURRENT_TIMESTAMP + INTERVAL '3 days'
+"""
+_SQL_ACTIVE_ROUTERS = "SELECT id, router_name, host, user_id FROM enhanced_user_routers WHERE is_active = TRUE"
+# Offline routers pass NULL and keep their previous last_seen
+_SQL_UPDATE_ROUTER_HEALTH = """
+    UPDATE enhanced_user_routers AS r
+    SET is_online = v.is_online, last_seen = COALESCE(v.last_seen, r.last_seen)
+    FROM (VALUES %s) AS v(id, is_online, last_seen)
+    WHERE r.id = v.id
+"""
+_ROUTER_HEALTH_TEMPLATE = "(%s::integer, %s::boolean, %s::timestamp)"
+
+
+def _parse_features(value: Any) -> Dict[str, Any]:
+    """Decode a features column; psycopg2 already returns JSONB as a dict"""
+    if isinstance(value, dict):
+        return value
+    try:
+        # orjson takes str/bytes directly; both decoders raise ValueError subclasses
+        return _json_loads(value)
+    except (ValueError, TypeError):
+        return {}
+
+
+@lru_cache(maxsize=1)
+def _get_fernet():
+    """Derive the router-password key once per process (PBKDF2 is deliberately slow)"""
+    # Imported on first use so processes that never touch router passwords
+    # skip loading the cryptography extension
+    import base64
+    from cryptography.fernet import Fernet
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+    
+    key = os.getenv("ENCRYPTION_KEY")
+    if not key:
+        raise ValueError("ENCRYPTION_KEY environment variable not set")
+    
+    salt = b'fixed_salt_change_in_production'
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        iterations=100000,
+    )
+    return Fernet(base64.urlsafe_b64encode(kdf.derive(key.encode())))
+
+
+class WarmThreadedConnectionPool(ThreadedConnectionPool):
+    """ThreadedConnectionPool that opens its initial connections concurrently
+    and keeps up to maxconn of them idle instead of closing those above minconn"""
+    
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        # Let the base class skip its sequential warmup, then connect in parallel
+        super().__init__(0, maxconn, *args, **kwargs)
+        self.minconn = int(minconn)
+        if self.minconn:
+            with ThreadPoolExecutor(max_workers=self.minconn) as executor:
+                list(executor.map(lambda _: self._connect(), range(self.minconn)))
+
+    def _putconn(self, conn, key=None, close=False):
+        # The base class closes returned connections once minconn are idle,
+        # so every borrow past minconn would reconnect and re-PREPARE.
+        # putconn() holds the pool lock, so swapping the threshold is safe.
+        minconn, self.minconn = self.minconn, self.maxconn
+        try:
+            super()._putconn(conn, key, close)
+        finally:
+            self.minconn = minconn
+
+
+class PreparedConnection(psycopg2.extensions.connection):
+    """Connection that remembers whether the hot statements were prepared"""
+    prepared = False
+    last_used = 0.0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Fresh connections are known good; skip the idle ping on first borrow
+        self.last_used = time.time()
+
 class DatabaseService:
     """Main database service with integrated user, router, and subscription management"""
     
     def __init__(self, config):
         self.config = config
-        self._connection_pool = []
-        self._max_pool_size = 10
+        self._pool = None
+        self._min_pool_size = 4
+        self._max_pool_size = 32
+        # Connections idle longer than this are pinged before being handed out
+        self._test_on_borrow_interval = 60
         self._pool_lock = threading.Lock()
+        # Callers wait for a free connection instead of getting PoolError
+        self._pool_slots = threading.BoundedSemaphore(self._max_pool_size)
         self._stats = {
             'queries_executed': 0,
             'connection_creates': 0,
@@ -33,6 +318,15 @@ class DatabaseService:
             'errors': 0
         }
         self._stats_lock = threading.Lock()
+        # user_id -> users.id never changes once assigned, so keep an LRU of it
+        self._user_db_ids = OrderedDict()
+        self._user_db_ids_max = 10_000
+        self._user_db_ids_lock = threading.Lock()
+        # Set by the cache listener whenever a subscription row changes
+        self.subscriptions_changed = threading.Event()
+        # Active packages by name, loaded on first use and dropped when any
+        # package changes; readers get an immutable snapshot
+        self._packages = None
         
         self.user_service = UserService(self)
         self.router_service = RouterService(self)
@@ -41,94 +335,179 @@ class DatabaseService:
         
         # Initialize connection pool
         self._initialize_pool()
+        
+        # Evict cached subscriptions/packages as soon as they change in PG
+        self._listener_stop = threading.Event()
+        self._listener_thread = threading.Thread(target=self._cache_listener_worker, daemon=True)
+        self._listener_thread.start()
 
-    def _initialize_pool(self):
-        """Initialize connection pool with minimum connections"""
-        for _ in range(3):
-            conn = self._create_connection()
-            if conn:
-                self._connection_pool.append(conn)
+    def _initialize_pool(self) -> Optional[ThreadedConnectionPool]:
+        """Create the shared connection pool (retried lazily if the DB is down)"""
+        with self._pool_lock:
+            if self._pool is not None:
+                return self._pool
+            try:
+                # Session settings travel in the startup packet instead of
+                # two SET round-trips on every new connection
+                self._pool = WarmThreadedConnectionPool(
+                    self._min_pool_size,
+                    self._max_pool_size,
+                    options="-c statement_timeout=30000 -c idle_in_transaction_session_timeout=60000",
+                    connection_factory=PreparedConnection,
+                    # Let the kernel detect dead peers instead of pinging per query
+                    keepalives=1,
+                    keepalives_idle=30,
+                    keepalives_interval=10,
+                    keepalives_count=3,
+                    **self.config.DB_CONFIG
+                )
+                with self._stats_lock:
+                    self._stats['connection_creates'] += self._min_pool_size
+            except Exception as e:
+                logger.error(f"Failed to create database connection pool: {e}")
+            return self._pool
 
-    def _create_connection(self) -> Optional[psycopg2.extensions.connection]:
-        """Create new database connection with health check"""
-        try:
-            conn = psycopg2.connect(**self.config.DB_CONFIG)
-            conn.autocommit = False
-            
-            # Set optimal connection parameters
-            with conn.cursor() as cursor:
-                cursor.execute("SET statement_timeout = 30000")
-                cursor.execute("SET idle_in_transaction_session_timeout = 60000")
-            
-            with self._stats_lock:
-                self._stats['connection_creates'] += 1
-                
-            return conn
-        except Exception as e:
-            logger.error(f"Failed to create database connection: {e}")
-            return None
+    @contextmanager
+    def get_connection(self):
+        """Get database connection from pool with context manager"""
+        pool = self._pool or self._initialize_pool()
+        if pool is None:
+            raise Exception("Failed to obtain database connection")
 
-    def _health_check(self, conn: psycopg2.extensions.connection) -> bool:
-        """Check if connection is healthy"""
+        self._pool_slots.acquire()
         try:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT 1")
-            return True
+            conn = pool.getconn()
         except Exception:
-            return False
+            self._pool_slots.release()
+            raise
 
-    @contextmanager
-    def get_connection(self):
-        """Get database connection from pool with context manager"""
-        conn = None
-        start_time = time.time()
-        
         try:
-            with self._pool_lock:
-                while self._connection_pool:
-                    conn = self._connection_pool.pop()
-                    if self._health_check(conn):
-                        break
-                    else:
-                        try:
-                            conn.close()
-                        except Exception:
-                            pass
-                        conn = None
-                
-                if not conn:
-                    conn = self._create_connection()
-            
-            if not conn:
-                raise Exception("Failed to obtain database connection")
-            
+            if time.time() - getattr(conn, 'last_used', 0.0) > self._test_on_borrow_interval:
+                conn = self._validate_idle_connection(pool, conn)
+            if not getattr(conn, 'prepared', True):
+                self._prepare_statements(conn)
             yield conn
-            
         except Exception as e:
             logger.error(f"Error in connection context: {e}")
             with self._stats_lock:
                 self._stats['errors'] += 1
             raise
         finally:
-            if conn:
-                try:
+            try:
+                if not conn.closed:
                     conn.rollback()
-                    
-                    with self._pool_lock:
-                        if (len(self._connection_pool) < self._max_pool_size and 
-                            self._health_check(conn)):
-                            self._connection_pool.append(conn)
-                            with self._stats_lock:
-                                self._stats['connection_returns'] += 1
-                        else:
-                            conn.close()
-                except Exception as e:
-                    logger.warning(f"Error returning connection to pool: {e}")
+            except Exception as e:
+                logger.warning(f"Error resetting pooled connection: {e}")
+            # Broken connections are discarded; the pool reopens on demand
+            conn.last_used = time.time()
+            try:
+                pool.putconn(conn, close=bool(conn.closed))
+            except Exception as e:
+                logger.warning(f"Error returning connection to pool: {e}")
+            finally:
+                self._pool_slots.release()
+            with self._stats_lock:
+                self._stats['connection_returns'] += 1
+
+    def _validate_idle_connection(self, pool, conn):
+        """Ping a connection that sat idle past the borrow interval; replace it if dead"""
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return conn
+        except psycopg2.Error:
+            pool.putconn(conn, close=True)
+            return pool.getconn()
+
+    def _cache_listener_worker(self):
+        """LISTEN on cache_invalidate and evict the announced cache keys"""
+        while not self._listener_stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.config.DB_CONFIG)
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute("LISTEN cache_invalidate")
+                
+                while not self._listener_stop.is_set():
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._on_cache_notify(conn.notifies.pop(0).payload)
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener error: {e}")
+                self._listener_stop.wait(10)
+            finally:
+                if conn:
                     try:
                         conn.close()
                     except Exception:
                         pass
 
+    def _invalidate_service_caches(self, key: str = None, prefix: str = None):
+        """Drop a cache key (or every key under a prefix) from every service"""
+        if (key or prefix or "").startswith("package_"):
+            self._packages = None
+        for service in (self.user_service, self.router_service,
+                        self.subscription_service, self.monitoring_service):
+            service._invalidate(key, prefix=prefix)
+    
+    def invalidate(self, key_prefix: str):
+        """Drop every service cache entry whose key starts with key_prefix"""
+        self._invalidate_service_caches(prefix=key_prefix)
+    
+    def _on_cache_notify(self, key: str):
+        """Evict a key announced by notify_cache_invalidate"""
+        self._invalidate_service_caches(key)
+        if key.startswith("subscription_"):
+            self._invalidate_service_caches(f"router_access_{key[len('subscription_'):]}")
+            self.subscriptions_changed.set()
+        # Cached subscriptions embed the package price and features
+        if key.startswith("package_"):
+            self._invalidate_service_caches(prefix="subscription_")
+            self._invalidate_service_caches(prefix="router_access_")
+
+    def _load_packages(self) -> MappingProxyType:
+        """Read every active package into a name -> package snapshot"""
+        rows = self.execute_query(_SQL_ACTIVE_PACKAGES, fetch=True) or []
+        packages = MappingProxyType({
+            row['package_name']: {**row, 'features': _parse_features(row['features'] or {})}
+            for row in rows
+        })
+        self._packages = packages
+        return packages
+
+    @property
+    def packages(self) -> MappingProxyType:
+        """Active packages by name (reloaded after any package change)"""
+        packages = self._packages
+        if packages is None:
+            packages = self._load_packages()
+        return packages
+
+    def _prepare_statements(self, conn):
+        """PREPARE the hot lookups on a fresh session (retried until the schema exists)"""
+        try:
+            with conn.cursor() as cursor:
+                for statement in PREPARED_STATEMENTS.values():
+                    cursor.execute(statement)
+            conn.commit()
+            conn.prepared = True
+        except psycopg2.Error as e:
+            # PREPARE survives ROLLBACK, so statements that succeeded before
+            # the failure would make every retry fail with "already exists";
+            # DEALLOCATE (once the aborted transaction is gone) starts clean
+            conn.rollback()
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("DEALLOCATE ALL")
+                conn.commit()
+            except psycopg2.Error:
+                conn.rollback()
+            logger.debug(f"Deferring prepared statements: {e}")
+
     def execute_query(
         self,
         query: str,
@@ -136,9 +515,21 @@ class DatabaseService:
         fetch: bool = False,
         fetch_one: bool = False,
         batch_data: list = None,
-        retries: int = 2
+        retries: int = 2,
+        values_template: str = None,
+        batch_page_size: int = 1000,
+        cursor_factory=RealDictCursor
     ) -> Any:
-        """Robust query execution with retry logic"""
+        """Robust query execution with retry logic.
+
+        With batch_data and values_template the query must contain a single
+        ``VALUES %s`` and is sent via execute_values (multi-row INSERTs, or
+        ``UPDATE ... FROM (VALUES %s)`` for bulk updates).
+        batch_page_size is the number of rows per round-trip; PostgreSQL
+        throughput plateaus around 1,000 and regresses past ~10,000.
+        cursor_factory defaults to dict rows; internal reads can pass
+        NamedTupleCursor (or None for plain tuples) to skip per-row dicts.
+        """
         last_exception = None
         
         for attempt in range(retries + 1):
@@ -146,9 +537,14 @@ class DatabaseService:
                 try:
                     start_time = time.time()
                     
-                    with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                        if batch_data:
-                            execute_batch(cursor, query, batch_data, page_size=100)
+                    with conn.cursor(cursor_factory=cursor_factory) as cursor:
+                        if batch_data and values_template:
+                            execute_values(
+                                cursor, query, batch_data,
+                                template=values_template, page_size=batch_page_size
+                            )
+                        elif batch_data:
+                            execute_batch(cursor, query, batch_data, page_size=batch_page_size)
                         else:
                             cursor.execute(query, params or ())
                         
@@ -160,6 +556,9 @@ class DatabaseService:
                         
                         conn.commit()
                         
+                        for prefix in _invalidation_prefixes(query):
+                            self.invalidate(prefix)
+                        
                         execution_time = time.time() - start_time
                         with self._stats_lock:
                             self._stats['queries_executed'] += 1
@@ -390,13 +789,6 @@ class DatabaseService:
             """
         ]
         
-        # Create tables
-        for query in tables_queries:
-            try:
-                self.execute_query(query)
-            except Exception as e:
-                logger.error(f"Error creating table: {e}")
-
         # Create performance indexes
         index_queries = [
             "CREATE INDEX IF NOT EXISTS idx_vouchers_code ON vouchers(voucher_code)",
@@ -409,7 +801,9 @@ class DatabaseService:
             "CREATE INDEX IF NOT EXISTS idx_users_last_seen ON all_users(last_seen)",
             "CREATE INDEX IF NOT EXISTS idx_users_activated ON all_users(activated_at)",
             "CREATE INDEX IF NOT EXISTS idx_profiles_name ON bandwidth_profiles(name)",
-            "CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)",
+            # Matches the LOWER(email)=LOWER(%s) login lookup; plain email is covered by its UNIQUE constraint
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email_lower ON users(LOWER(email))",
+            "DROP INDEX IF EXISTS idx_users_email",
             "CREATE INDEX IF NOT EXISTS idx_users_user_id ON users(user_id)",
             "CREATE INDEX IF NOT EXISTS idx_user_routers_user_id ON user_routers(user_id)",
             "CREATE INDEX IF NOT EXISTS idx_user_sessions_token ON user_sessions(token)",
@@ -425,16 +819,76 @@ class DatabaseService:
             "CREATE INDEX IF NOT EXISTS idx_enhanced_user_routers_last_seen ON enhanced_user_routers(last_seen)",
             "CREATE INDEX IF NOT EXISTS idx_router_monitoring_router_id ON router_monitoring(router_id)",
             "CREATE INDEX IF NOT EXISTS idx_user_activity_user_id ON user_activity(user_id)",
+            # Partial indexes for the active-subscription lookup (newest end_date
+            # first, LIMIT 1) and the active-router counts
+            "CREATE INDEX IF NOT EXISTS idx_usersub_active ON user_subscriptions(user_id, end_date DESC) WHERE is_active",
+            "CREATE INDEX IF NOT EXISTS idx_routers_active ON enhanced_user_routers(user_id) WHERE is_active",
         ]
 
-        for query in index_queries:
-            try:
-                self.execute_query(query)
-            except Exception as e:
-                logger.warning(f"Could not create index: {e}")
+        # Publish cache keys for rows the services cache (see _cache_listener_worker)
+        trigger_queries = [
+            """
+            CREATE OR REPLACE FUNCTION notify_cache_invalidate() RETURNS trigger AS $$
+            DECLARE
+                row_data RECORD;
+                cache_key TEXT;
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    row_data := OLD;
+                ELSE
+                    row_data := NEW;
+                END IF;
+                IF TG_TABLE_NAME = 'subscription_packages' THEN
+                    cache_key := 'package_' || row_data.package_name;
+                ELSE
+                    SELECT 'subscription_' || u.user_id INTO cache_key
+                    FROM users u WHERE u.id = row_data.user_id;
+                END IF;
+                IF cache_key IS NOT NULL THEN
+                    PERFORM pg_notify('cache_invalidate', cache_key);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            "DROP TRIGGER IF EXISTS trg_user_subscriptions_cache ON user_subscriptions",
+            """
+            CREATE TRIGGER trg_user_subscriptions_cache
+            AFTER INSERT OR UPDATE OR DELETE ON user_subscriptions
+            FOR EACH ROW EXECUTE PROCEDURE notify_cache_invalidate()
+            """,
+            "DROP TRIGGER IF EXISTS trg_subscription_packages_cache ON subscription_packages",
+            """
+            CREATE TRIGGER trg_subscription_packages_cache
+            AFTER INSERT OR UPDATE OR DELETE ON subscription_packages
+            FOR EACH ROW EXECUTE PROCEDURE notify_cache_invalidate()
+            """,
+        ]
+
+        # All DDL goes out as one simple-query message in a single transaction
+        try:
+            self.execute_query(";\n".join(tables_queries + index_queries + trigger_queries))
+        except Exception as e:
+            logger.error(f"Batched schema setup failed, retrying statements individually: {e}")
+            for query in tables_queries:
+                try:
+                    self.execute_query(query)
+                except Exception as e:
+                    logger.error(f"Error creating table: {e} -- {query.strip()[:80]}")
+            for query in index_queries:
+                try:
+                    self.execute_query(query)
+                except Exception as e:
+                    logger.warning(f"Could not create index: {e} -- {query}")
+            for query in trigger_queries:
+                try:
+                    self.execute_query(query)
+                except Exception as e:
+                    logger.warning(f"Could not create cache trigger: {e} -- {query.strip()[:80]}")
 
         # Insert default data
         self._insert_default_data()
+        self._load_packages()
 
     def _insert_default_data(self):
         """Insert default packages and pricing rates"""
@@ -446,116 +900,143 @@ class DatabaseService:
                 ('Professional', 5, 80000, '{"wireguard": true, "advanced_monitoring": true, "interface_alerts": true, "offline_notifications": true, "sms_alerts": true}')
             ]
             
-            self.execute_query(
-                """
-                INSERT INTO subscription_packages (package_name, router_limit, price, features)
-                VALUES (%s, %s, %s, %s::jsonb)
-                ON CONFLICT (package_name) DO UPDATE SET
-                    router_limit = EXCLUDED.router_limit,
-                    price = EXCLUDED.price,
-                    features = EXCLUDED.features
-                """,
-                batch_data=default_packages
-            )
-            
             # Default pricing rates
             default_rates = [("day", 1000), ("week", 6000), ("month", 25000)]
-            self.execute_query(
-                """
-                INSERT INTO pricing_rates (rate_type, amount)
-                VALUES (%s, %s)
-                ON CONFLICT (rate_type) DO NOTHING
-                """,
-                batch_data=default_rates
-            )
+            
+            # Both seeds share one connection and one commit
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    execute_values(
+                        cursor,
+                        """
+                        INSERT INTO subscription_packages (package_name, router_limit, price, features)
+                        VALUES %s
+                        ON CONFLICT (package_name) DO UPDATE SET
+                            router_limit = EXCLUDED.router_limit,
+                            price = EXCLUDED.price,
+                            features = EXCLUDED.features
+                        """,
+                        default_packages,
+                        template="(%s, %s, %s, %s::jsonb)"
+                    )
+                    execute_values(
+                        cursor,
+                        """
+                        INSERT INTO pricing_rates (rate_type, amount)
+                        VALUES %s
+                        ON CONFLICT (rate_type) DO NOTHING
+                        """,
+                        default_rates
+                    )
+                conn.commit()
+            
+            self._invalidate_service_caches(prefix="package_")
+            self._invalidate_service_caches(prefix="subscription_")
+            self._invalidate_service_caches(prefix="router_access_")
             
         except Exception as e:
             logger.error(f"Error inserting default data: {e}")
 
     def _encrypt_password(self, password: str) -> str:
         """Encrypt password with proper key management"""
-        key = os.getenv("ENCRYPTION_KEY")
-        if not key:
-            raise ValueError("ENCRYPTION_KEY environment variable not set")
-        
-        salt = b'fixed_salt_change_in_production'
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=100000,
-        )
-        key = base64.urlsafe_b64encode(kdf.derive(key.encode()))
-        fernet = Fernet(key)
-        return fernet.encrypt(password.encode()).decode()
+        return _get_fernet().encrypt(password.encode()).decode()
 
     def _decrypt_password(self, encrypted_password: str) -> str:
         """Decrypt password"""
         try:
-            key = os.getenv("ENCRYPTION_KEY")
-            if not key:
-                raise ValueError("ENCRYPTION_KEY environment variable not set")
-            
-            salt = b'fixed_salt_change_in_production'
-            kdf = PBKDF2HMAC(
-                algorithm=hashes.SHA256(),
-                length=32,
-                salt=salt,
-                iterations=100000,
-            )
-            key = base64.urlsafe_b64encode(kdf.derive(key.encode()))
-            fernet = Fernet(key)
-            return fernet.decrypt(encrypted_password.encode()).decode()
+            return _get_fernet().decrypt(encrypted_password.encode()).decode()
         except Exception as e:
             logger.error(f"Error decrypting password: {e}")
             return ""
 
+    def close(self):
+        """Stop the cache listener and close every pooled connection"""
+        self._listener_stop.set()
+        if self._listener_thread.is_alive():
+            self._listener_thread.join(timeout=10)
+        
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+
     def get_stats(self) -> Dict[str, Any]:
         """Get database performance statistics"""
         with self._stats_lock:
             stats = self._stats.copy()
         
-        stats['pool_size'] = len(self._connection_pool)
+        stats['pool_size'] = len(self._pool._pool) if self._pool else 0
         stats['pool_max_size'] = self._max_pool_size
+        stats['cache_entries'] = {
+            type(service).__name__: len(service._cache)
+            for service in (self.user_service, self.router_service,
+                            self.subscription_service, self.monitoring_service)
+        }
+        stats['user_db_id_entries'] = len(self._user_db_ids)
         
         return stats
 
     # Original methods maintained for backward compatibility
     def get_voucher(self, voucher_code: str) -> Optional[Dict[str, Any]]:
         return self.execute_query(
-            "SELECT * FROM vouchers WHERE voucher_code=%s",
+            _SQL_EXECUTE_VOUCHER_BY_CODE,
             (voucher_code,),
             fetch_one=True
         )
 
     def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
-        return self.execute_query(
-            "SELECT * FROM users WHERE LOWER(email)=LOWER(%s)", 
+        user = self.execute_query(
+            _SQL_EXECUTE_USER_BY_EMAIL, 
             (email,), 
             fetch_one=True
         )
+        if user:
+            self._remember_user_db_id(user['user_id'], user['id'])
+        return user
 
     def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
-        return self.execute_query(
-            "SELECT * FROM users WHERE user_id=%s", 
+        user = self.execute_query(
+            _SQL_EXECUTE_USER_BY_ID, 
             (user_id,), 
             fetch_one=True
         )
+        if user:
+            self._remember_user_db_id(user['user_id'], user['id'])
+        return user
+
+    def _remember_user_db_id(self, user_id: str, db_id: int):
+        """Record a user_id -> users.id mapping, evicting the oldest past the limit"""
+        with self._user_db_ids_lock:
+            self._user_db_ids[user_id] = db_id
+            self._user_db_ids.move_to_end(user_id)
+            if len(self._user_db_ids) > self._user_db_ids_max:
+                self._user_db_ids.popitem(last=False)
 
     def _get_user_db_id(self, user_id: str) -> int:
         """Get database internal ID from user_id"""
-        user = self.get_user_by_id(user_id)
-        return user["id"] if user else None
+        with self._user_db_ids_lock:
+            db_id = self._user_db_ids.get(user_id)
+            if db_id is not None:
+                self._user_db_ids.move_to_end(user_id)
+                return db_id
+        
+        row = self.execute_query(
+            _SQL_GET_USER_DB_ID,
+            (user_id,),
+            fetch_one=True,
+            cursor_factory=NamedTupleCursor
+        )
+        if not row:
+            return None
+        
+        self._remember_user_db_id(user_id, row.id)
+        return row.id
 
     # Additional original methods...
     def add_voucher(self, voucher_data: dict) -> bool:
         try:
             self.execute_query(
-                """
-                INSERT INTO vouchers (voucher_code, profile_name, customer_name, customer_contact, 
-                    expiry_time, uptime_limit, password_type)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """,
+                _SQL_INSERT_VOUCHER,
                 (
                     voucher_data["voucher_code"],
                     voucher_data["profile_name"],
@@ -574,40 +1055,36 @@ class DatabaseService:
 class BaseService:
     """Base service class with common functionality"""
     
+    # Upper bound on cached entries per service; the LRU entry is evicted past it
+    _cache_maxsize = 10_000
+    
     def __init__(self, db_service: DatabaseService):
         self.db = db_service
-        self._cache = {}
-        self._cache_lock = threading.Lock()
         self._cache_ttl = 300
+        # TTLCache expires entries lazily, so lookups never scan the cache
+        self._cache = TTLCache(maxsize=self._cache_maxsize, ttl=self._cache_ttl)
+        self._cache_lock = threading.Lock()
     
-    def _clean_cache(self, key: str = None):
-        """Clean cache entries"""
-        current_time = time.time()
+    def _invalidate(self, key: str = None, prefix: str = None):
+        """Drop one cache entry, every entry under a prefix, or everything"""
         with self._cache_lock:
-            if key:
-                if key in self._cache and current_time - self._cache[key]['timestamp'] > self._cache_ttl:
-                    del self._cache[key]
+            if prefix:
+                for cached_key in [k for k in self._cache if k.startswith(prefix)]:
+                    self._cache.pop(cached_key, None)
+            elif key:
+                self._cache.pop(key, None)
             else:
-                expired_keys = [
-                    k for k, v in self._cache.items() 
-                    if current_time - v['timestamp'] > self._cache_ttl
-                ]
-                for k in expired_keys:
-                    del self._cache[k]
+                self._cache.clear()
     
     def _get_cached(self, key: str) -> Any:
         """Get cached value"""
-        self._clean_cache(key)
         with self._cache_lock:
-            return self._cache.get(key, {}).get('value')
+            return self._cache.get(key)
     
     def _set_cached(self, key: str, value: Any):
         """Set cached value"""
         with self._cache_lock:
-            self._cache[key] = {
-                'value': value,
-                'timestamp': time.time()
-            }
+            self._cache[key] = value
 
 class UserService(BaseService):
     """User management service integrated with DatabaseService"""
@@ -618,20 +1095,13 @@ class UserService(BaseService):
             if not user_data.get("email") or not user_data.get("password"):
                 return {"success": False, "message": "Email and password are required"}
             
-            # Check existing user
-            existing_user = self.db.get_user_by_email(user_data["email"])
-            if existing_user:
-                return {"success": False, "message": "User with this email already exists"}
-            
             # Generate user ID
             user_id = f"usr_{int(time.time())}_{random.randint(1000, 9999)}"
             
-            # Create user
-            self.db.execute_query(
-                """
-                INSERT INTO users (user_id, email, password, full_name, phone, company_name, role, is_verified)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                """,
+            # Create user and log activity in one statement; no row back means
+            # the email is already registered
+            created = self.db.execute_query(
+                _SQL_REGISTER_USER,
                 (
                     user_id,
                     user_data["email"],
@@ -641,17 +1111,13 @@ class UserService(BaseService):
                     user_data.get("company_name", ""),
                     "user",
                     False
-                )
+                ),
+                fetch_one=True
             )
+            if not created:
+                return {"success": False, "message": "User with this email already exists"}
             
-            # Log activity
-            self.db.execute_query(
-                """
-                INSERT INTO user_activity (user_id, action_type, description)
-                VALUES (%s, %s, %s)
-                """,
-                (self.db._get_user_db_id(user_id), "REGISTRATION", "User registered successfully")
-            )
+            self.db._remember_user_db_id(user_id, created['id'])
             
             return {
                 "success": True,
@@ -665,73 +1131,40 @@ class UserService(BaseService):
 
     def activate_subscription(self, user_id: str, voucher_code: str) -> Dict[str, Any]:
         try:
-            user = self.db.get_user_by_id(user_id)
-            if not user:
-                return {"success": False, "message": "User not found"}
+            # Start/end dates are computed by the server from the validity
+            validity_days = 30
             
-            voucher = self.db.get_voucher(voucher_code)
-            if not voucher:
+            # Activate subscription in a single round-trip
+            result = self.db.execute_query(
+                _SQL_ACTIVATE_SUBSCRIPTION,
+                (voucher_code, user_id, validity_days),
+                fetch_one=True
+            )
+            if not result:
                 return {"success": False, "message": "Invalid voucher code"}
             
-            if voucher.get('is_used'):
-                return {"success": False, "message": "Voucher already used"}
+            if result['user_db_id'] is None:
+                return {"success": False, "message": "User not found"}
+            self.db._remember_user_db_id(user_id, result['user_db_id'])
             
-            # Map voucher to package
-            package_type = self._map_voucher_to_package(voucher)
-            package = self._get_package_details(package_type)
+            if result['is_used']:
+                return {"success": False, "message": "Voucher already used"}
             
-            if not package:
+            package_type = result['package_type']
+            if result['router_limit'] is None or result['subscription_id'] is None:
                 return {"success": False, "message": f"Invalid package: {package_type}"}
             
-            # Calculate dates
-            start_date = datetime.now()
-            validity_days = voucher.get('validity_period', 30)
-            end_date = start_date + timedelta(days=validity_days)
-            
-            # Activate subscription
-            with self.db.get_connection() as conn:
-                with conn.cursor() as cursor:
-                    # Create subscription
-                    cursor.execute(
-                        """
-                        INSERT INTO user_subscriptions 
-                        (user_id, voucher_code, package_type, router_limit, start_date, end_date, is_active)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s)
-                        RETURNING id
-                        """,
-                        (
-                            self.db._get_user_db_id(user_id),
-                            voucher_code,
-                            package_type,
-                            package['router_limit'],
-                            start_date,
-                            end_date,
-                            True
-                        )
-                    )
-                    
-                    # Mark voucher used
-                    cursor.execute(
-                        "UPDATE vouchers SET is_used = TRUE, activated_at = %s WHERE voucher_code = %s",
-                        (start_date, voucher_code)
-                    )
-                    
-                    # Activate user
-                    cursor.execute(
-                        "UPDATE users SET is_verified = TRUE, is_active = TRUE WHERE user_id = %s",
-                        (user_id,)
-                    )
-                    
-                    conn.commit()
-            
             # Clear cache
-            self._clean_cache(f"subscription_{user_id}")
+            self._invalidate(f"subscription_{user_id}")
+            self._invalidate(f"router_access_{user_id}")
             
+            end_date = result['end_date']
             return {
                 "success": True,
                 "message": f"Subscription activated! {package_type} package active until {end_date.strftime('%Y-%m-%d')}",
                 "package": package_type,
-                "router_limit": package['router_limit'],
+                "router_limit": result['router_limit'],
+                "start_date": result['start_date'],
                 "end_date": end_date
             }
             
@@ -739,35 +1172,16 @@ class UserService(BaseService):
             logger.error(f"Subscription activation failed: {e}")
             return {"success": False, "message": "Activation failed"}
 
-    def _map_voucher_to_package(self, voucher: Dict[str, Any]) -> str:
-        profile_name = voucher.get('profile_name', 'Basic').lower()
-        if 'professional' in profile_name:
-            return 'Professional'
-        elif 'premium' in profile_name:
-            return 'Premium'
-        else:
-            return 'Basic'
-
-    def _get_package_details(self, package_name: str) -> Optional[Dict[str, Any]]:
-        cache_key = f"package_{package_name}"
+    def _get_parsed_features(self, package_id: int, row_version: str, raw: Any) -> Dict[str, Any]:
+        """Parse package features once per package row version"""
+        cache_key = f"package_raw_{package_id}"
         cached = self._get_cached(cache_key)
-        if cached:
-            return cached
+        if cached and cached[0] == row_version:
+            return cached[1]
         
-        package = self.db.execute_query(
-            "SELECT * FROM subscription_packages WHERE package_name = %s AND is_active = TRUE",
-            (package_name,),
-            fetch_one=True
-        )
-        
-        if package and package.get('features'):
-            try:
-                package['features'] = json.loads(package['features'])
-            except (json.JSONDecodeError, TypeError):
-                package['features'] = {}
-        
-        self._set_cached(cache_key, package)
-        return package
+        features = _parse_features(raw) if raw else {}
+        self._set_cached(cache_key, (row_version, features))
+        return features
 
     def get_user_subscription(self, user_id: str) -> Optional[Dict[str, Any]]:
         cache_key = f"subscription_{user_id}"
@@ -776,29 +1190,21 @@ class UserService(BaseService):
             return cached
         
         subscription = self.db.execute_query(
-            """
-            SELECT us.*, sp.features, sp.price,
-                   EXTRACT(DAYS FROM (us.end_date - CURRENT_TIMESTAMP)) as days_remaining
-            FROM user_subscriptions us
-            JOIN subscription_packages sp ON us.package_type = sp.package_name
-            WHERE us.user_id = %s AND us.is_active = TRUE AND us.end_date > CURRENT_TIMESTAMP
-            ORDER BY us.end_date DESC
-            LIMIT 1
-            """,
+            _SQL_GET_ACTIVE_SUBSCRIPTION,
             (self.db._get_user_db_id(user_id),),
             fetch_one=True
         )
         
-        if subscription and subscription.get('features'):
-            try:
-                subscription['features'] = json.loads(subscription['features'])
-            except (json.JSONDecodeError, TypeError):
-                subscription['features'] = {}
+        if subscription:
+            subscription['features'] = self._get_parsed_features(
+                subscription.pop('package_id'), subscription.pop('row_version'),
+                subscription['features']
+            )
         
         self._set_cached(cache_key, subscription)
         return subscription
 
-    def validate_user_access(self, user_id: str) -> Dict[str, Any]:
+    def validate_user_access(self, user_id: str, now: Optional[datetime] = None) -> Dict[str, Any]:
         user = self.db.get_user_by_id(user_id)
         if not user or not user.get('is_active'):
             return {"has_access": False, "reason": "User account inactive"}
@@ -807,7 +1213,7 @@ class UserService(BaseService):
         if not subscription:
             return {"has_access": False, "reason": "No active subscription"}
         
-        if subscription['end_date'] < datetime.now():
+        if subscription['end_date'] < (now or datetime.now()):
             return {"has_access": False, "reason": "Subscription expired"}
         
         return {
@@ -817,19 +1223,47 @@ class UserService(BaseService):
             "days_remaining": subscription.get('days_remaining', 0)
         }
 
-    def can_add_router(self, user_id: str) -> Dict[str, Any]:
-        access_check = self.validate_user_access(user_id)
-        if not access_check["has_access"]:
-            return {"can_add": False, "reason": access_check["reason"]}
+    def _get_router_access(self, user_id: str) -> Optional[tuple]:
+        """(is_active, subscription, router_count) for a user, or None if unknown"""
+        cache_key = f"router_access_{user_id}"
+        cached = self._get_cached(cache_key)
+        if cached:
+            return cached
         
-        router_count = self.db.execute_query(
-            "SELECT COUNT(*) as count FROM enhanced_user_routers WHERE user_id = %s AND is_active = TRUE",
-            (self.db._get_user_db_id(user_id),),
+        row = self.db.execute_query(
+            _SQL_ROUTER_ACCESS,
+            (user_id,),
             fetch_one=True
         )
+        if not row:
+            return None
+        
+        user_active = row.pop('user_active')
+        router_count = row.pop('router_count')
+        subscription = None
+        if row['id'] is not None:
+            subscription = row
+            subscription['features'] = self._get_parsed_features(
+                subscription.pop('package_id'), subscription.pop('row_version'),
+                subscription['features']
+            )
+        
+        access = (user_active, subscription, router_count)
+        self._set_cached(cache_key, access)
+        return access
+
+    def can_add_router(self, user_id: str) -> Dict[str, Any]:
+        access = self._get_router_access(user_id)
+        if not access or not access[0]:
+            return {"can_add": False, "reason": "User account inactive"}
+        
+        user_active, subscription, current_count = access
+        if not subscription:
+            return {"can_add": False, "reason": "No active subscription"}
+        # The cached row may outlive the subscription; check expiry per call
+        if subscription['end_date'] < datetime.now():
+            return {"can_add": False, "reason": "Subscription expired"}
         
-        current_count = router_count['count'] if router_count else 0
-        subscription = access_check["subscription"]
         router_limit = subscription['router_limit']
         
         if current_count >= router_limit:
@@ -856,15 +1290,8 @@ class RouterService(BaseService):
     
     def add_user_router(self, user_id: str, router_data: dict) -> Dict[str, Any]:
         try:
-            user_service = UserService(self.db)
-            
-            # Validate access
-            access_check = user_service.validate_user_access(user_id)
-            if not access_check["has_access"]:
-                return {"success": False, "message": access_check["reason"]}
-            
-            # Check router limit
-            can_add = user_service.can_add_router(user_id)
+            # Check account, subscription and router limit
+            can_add = self.db.user_service.can_add_router(user_id)
             if not can_add["can_add"]:
                 return {"success": False, "message": can_add["reason"]}
             
@@ -883,15 +1310,10 @@ class RouterService(BaseService):
             # Encrypt password
             encrypted_password = self.db._encrypt_password(router_data["password"])
             
-            # Save router
+            # Save router, set up WireGuard (simplified - in real implementation,
+            # configure on router) and log activity
             router_id = self.db.execute_query(
-                """
-                INSERT INTO enhanced_user_routers 
-                (user_id, router_name, host, username, password, model, location, 
-                 wireguard_public_key, wireguard_private_key, description)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
-                """,
+                _SQL_INSERT_ROUTER,
                 (
                     self.db._get_user_db_id(user_id),
                     router_data["router_name"],
@@ -902,27 +1324,14 @@ class RouterService(BaseService):
                     router_data.get("location", ""),
                     wg_keys["public_key"],
                     wg_keys["private_key"],
-                    router_data.get("description", "")
+                    router_data.get("description", ""),
+                    _WIREGUARD_PORT,
+                    f"Added router: {router_data['router_name']}"
                 ),
                 fetch_one=True
             )["id"]
             
-            # Setup WireGuard (simplified - in real implementation, configure on router)
-            setup_result = self._setup_wireguard(router_id, router_data, wg_keys)
-            
-            if not setup_result["success"]:
-                # Rollback
-                self.db.execute_query("DELETE FROM enhanced_user_routers WHERE id = %s", (router_id,))
-                return setup_result
-            
-            # Log activity
-            self.db.execute_query(
-                """
-                INSERT INTO user_activity (user_id, action_type, description)
-                VALUES (%s, %s, %s)
-                """,
-                (self.db._get_user_db_id(user_id), "ROUTER_ADD", f"Added router: {router_data['router_name']}")
-            )
+            self.db._invalidate_service_caches(f"router_access_{user_id}")
             
             return {
                 "success": True,
@@ -957,63 +1366,47 @@ class RouterService(BaseService):
             "private_key": f"priv_{timestamp}"
         }
 
-    def _setup_wireguard(self, router_id: int, router_data: dict, wg_keys: dict) -> Dict[str, Any]:
-        # Simplified WireGuard setup
-        # In real implementation, configure WireGuard on the actual router
-        try:
-            self.db.execute_query(
-                """
-                UPDATE enhanced_user_routers 
-                SET wireguard_interface = %s, wireguard_port = %s, is_wireguard_setup = %s
-                WHERE id = %s
-                """,
-                (f"wg-{router_id}", 51820, True, router_id)
-            )
-            return {"success": True, "interface_name": f"wg-{router_id}"}
-        except Exception as e:
-            return {"success": False, "message": str(e)}
-
     def get_user_routers(self, user_id: str) -> List[Dict[str, Any]]:
-        routers = self.db.execute_query(
-            """
-            SELECT id, router_name, host, model, location, is_online, last_seen, 
-                   is_wireguard_setup, created_at
-            FROM enhanced_user_routers 
-            WHERE user_id = %s AND is_active = TRUE
-            ORDER BY created_at DESC
-            """,
+        cache_key = f"user_routers_{user_id}"
+        cached = self._get_cached(cache_key)
+        if cached is not None:
+            return cached
+        
+        # Plain tuples skip RealDictRow construction; zip with the known columns
+        rows = self.db.execute_query(
+            _SQL_GET_USER_ROUTERS,
             (self.db._get_user_db_id(user_id),),
-            fetch=True
+            fetch=True,
+            cursor_factory=None
         ) or []
+        routers = [dict(zip(_USER_ROUTER_COLUMNS, row)) for row in rows]
         
+        self._set_cached(cache_key, routers)
         return routers
 
 class SubscriptionService(BaseService):
     """Subscription management service"""
     
     def get_subscription_summary(self, user_id: str) -> Dict[str, Any]:
-        user_service = UserService(self.db)
-        access_check = user_service.validate_user_access(user_id)
-        
-        if not access_check["has_access"]:
-            return access_check
-        
-        subscription = access_check["subscription"]
+        # Same single query (and cache entry) as can_add_router
+        access = self.db.user_service._get_router_access(user_id)
+        if not access or not access[0]:
+            return {"has_access": False, "reason": "User account inactive"}
         
-        # Get router count
-        router_count = self.db.execute_query(
-            "SELECT COUNT(*) as count FROM enhanced_user_routers WHERE user_id = %s AND is_active = TRUE",
-            (self.db._get_user_db_id(user_id),),
-            fetch_one=True
-        )
+        user_active, subscription, router_count = access
+        if not subscription:
+            return {"has_access": False, "reason": "No active subscription"}
+        # The cached row may outlive the subscription; check expiry per call
+        if subscription['end_date'] < datetime.now():
+            return {"has_access": False, "reason": "Subscription expired"}
         
         return {
             "has_access": True,
             "subscription": subscription,
             "router_usage": {
-                "current": router_count['count'] if router_count else 0,
+                "current": router_count,
                 "limit": subscription['router_limit'],
-                "remaining": max(0, subscription['router_limit'] - (router_count['count'] if router_count else 0))
+                "remaining": max(0, subscription['router_limit'] - router_count)
             },
             "time_remaining": {
                 "days": subscription.get('days_remaining', 0),
@@ -1028,27 +1421,21 @@ class MonitoringService(BaseService):
     def __init__(self, db_service: DatabaseService):
         super().__init__(db_service)
         self._last_checks = {}
+        self._rng = np.random.default_rng()
     
-    def check_subscription_expiry(self):
+    def check_subscription_expiry(self, now: Optional[datetime] = None):
         """Check for expiring subscriptions"""
         try:
             # Subscriptions expiring in 3 days
             expiring_soon = self.db.execute_query(
-                """
-                SELECT us.*, u.email, u.full_name, u.phone
-                FROM user_subscriptions us
-                JOIN users u ON us.user_id = u.id
-                WHERE us.is_active = TRUE 
-                AND us.end_date BETWEEN CURRENT_TIMESTAMP AND CURRENT_TIMESTAMP + INTERVAL '3 days'
-                AND u.is_active = TRUE
-                """,
-                fetch=True
+                _SQL_EXPIRING_SUBSCRIPTIONS,
+                fetch=True,
+                cursor_factory=None
             ) or []
             
-            for subscription in expiring_soon:
-                self._send_expiry_notification(subscription, 'expiring_soon')
+            self._send_expiry_notifications(expiring_soon, 'expiring_soon')
             
-            self._last_checks['subscriptions'] = datetime.now()
+            self._last_checks['subscriptions'] = now or datetime.now()
             
             return len(expiring_soon)
             
@@ -1056,51 +1443,77 @@ class MonitoringService(BaseService):
             logger.error(f"Subscription expiry check failed: {e}")
             return 0
     
-    def check_router_health(self):
+    def check_router_health(self, now: Optional[datetime] = None):
         """Check router connectivity"""
+        now = now or datetime.now()
         try:
             routers = self.db.execute_query(
-                "SELECT id, router_name, host, user_id FROM enhanced_user_routers WHERE is_active = TRUE",
+                _SQL_ACTIVE_ROUTERS,
                 fetch=True
             ) or []
             
-            offline_count = 0
-            for router in routers:
-                # Simplified health check - in real implementation, test connectivity
-                is_online = random.choice([True, False])  # Simulated
-                
-                self.db.execute_query(
-                    "UPDATE enhanced_user_routers SET is_online = %s, last_seen = %s WHERE id = %s",
-                    (is_online, datetime.now() if is_online else router.get('last_seen'), router['id'])
-                )
-                
-                if not is_online:
-                    offline_count += 1
+            if not routers:
+                self._last_checks['routers'] = now
+                return 0
+            
+            flags = self._probe_routers(routers)
+            offline_count = int(np.count_nonzero(~flags))
+            
+            updates = [
+                (router['id'], is_online, now if is_online else None)
+                for router, is_online in zip(routers, flags.tolist())
+            ]
+            self.db.execute_query(
+                _SQL_UPDATE_ROUTER_HEALTH,
+                batch_data=updates,
+                values_template=_ROUTER_HEALTH_TEMPLATE
+            )
             
-            self._last_checks['routers'] = datetime.now()
+            self._last_checks['routers'] = now
             return offline_count
             
         except Exception as e:
             logger.error(f"Router health check failed: {e}")
             return 0
     
-    def _send_expiry_notification(self, subscription: Dict[str, Any], notification_type: str):
-        """Send notification (simplified - log instead of actual email/SMS)"""
-        days_remaining = (subscription['end_date'] - datetime.now()).days
+    def seconds_until_next_expiry_window(self) -> Optional[float]:
+        """Time until another subscription becomes 'expiring soon', or None"""
+        row = self.db.execute_query(_SQL_NEXT_EXPIRY_WINDOW, fetch_one=True, cursor_factory=None)
+        if not row or row[0] is None:
+            return None
+        return max(float(row[0]), 0.0)
+    
+    def _probe_routers(self, routers: List[Dict[str, Any]]):
+        # Simplified health check - in real implementation, test connectivity
+        # Simulated: draw every router's state in one vectorized call
+        return self._rng.random(len(routers)) < 0.5
+    
+    def _send_expiry_notifications(self, subscriptions: List[Tuple[str, int]], notification_type: str):
+        """Send notifications (simplified - one log record instead of actual email/SMS)"""
+        if not subscriptions:
+            return
         
         if notification_type == 'expiring_soon':
-            message = f"Subscription for {subscription['full_name']} expires in {days_remaining} days"
+            messages = [
+                f"NOTIFICATION: Subscription for {full_name} expires in {days_remaining} days"
+                for full_name, days_remaining in subscriptions
+            ]
         else:
-            message = f"Subscription for {subscription['full_name']} has expired"
+            messages = [
+                f"NOTIFICATION: Subscription for {full_name} has expired"
+                for full_name, _ in subscriptions
+            ]
         
-        logger.info(f"NOTIFICATION: {message}")
+        logger.info("\n".join(messages))
     
     def run_health_checks(self) -> Dict[str, Any]:
         """Run all health checks"""
+        # One clock read shared by every check in this pass
+        now = datetime.now()
         return {
-            'subscriptions_expiring': self.check_subscription_expiry(),
-            'routers_offline': self.check_router_health(),
-            'timestamp': datetime.now()
+            'subscriptions_expiring': self.check_subscription_expiry(now),
+            'routers_offline': self.check_router_health(now),
+            'timestamp': now
         }
 
 # Service Coordinator for managing all services
@@ -1112,6 +1525,7 @@ class ServiceCoordinator:
         self.db = DatabaseService(config)
         self._running = False
         self._monitoring_thread = None
+        self._router_check_interval = 300
     
     def start_services(self):
         """Start all background services"""
@@ -1133,21 +1547,46 @@ class ServiceCoordinator:
     def stop_services(self):
         """Stop all background services"""
         self._running = False
+        # Wake the monitoring worker so it notices the stop immediately
+        self.db.subscriptions_changed.set()
         if self._monitoring_thread:
             self._monitoring_thread.join(timeout=10)
         
+        self.db.close()
         logger.info("All services stopped")
     
     def _monitoring_worker(self):
-        """Background monitoring worker"""
+        """Background monitoring worker.
+
+        Router health still runs every _router_check_interval. The expiry
+        check runs only when a subscription changes (NOTIFY via the cache
+        listener) or when the next subscription enters the expiry window.
+        """
+        monitoring = self.db.monitoring_service
+        changed = self.db.subscriptions_changed
+        check_expiry = True
+        next_router_check = 0.0
         while self._running:
             try:
-                # Run health checks every 5 minutes
-                self.db.monitoring_service.run_health_checks()
-                time.sleep(300)  # 5 minutes
+                if check_expiry:
+                    monitoring.check_subscription_expiry()
+                if time.time() >= next_router_check:
+                    monitoring.check_router_health()
+                    next_router_check = time.time() + self._router_check_interval
+                
+                timeout = next_router_check - time.time()
+                until_expiry = monitoring.seconds_until_next_expiry_window()
+                if until_expiry is not None:
+                    timeout = min(timeout, until_expiry)
+                expiry_at = time.time() + until_expiry if until_expiry is not None else None
+                
+                woken = changed.wait(max(timeout, 1))
+                changed.clear()
+                check_expiry = woken or (expiry_at is not None and time.time() >= expiry_at)
             except Exception as e:
                 logger.error(f"Monitoring worker error: {e}")
-                time.sleep(60)
+                check_expiry = True
+                changed.wait(60)
     
     def get_system_status(self) -> Dict[str, Any]:
         """Get comprehensive system status"""
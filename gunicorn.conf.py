@@ -0,0 +1,31 @@
+# gunicorn.conf.py
+#
+#   gunicorn -c gunicorn.conf.py "app:create_app()"
+#
+# app.py monkey-patches with eventlet on import, which makes the RouterOS API
+# and SMS/email sockets cooperative, and installs psycogreen's wait callback
+# so psycopg2 queries yield to the hub instead of blocking it. A single green
+# worker then overlaps MikroTik, database and SMS/email I/O across requests;
+# bcrypt and PDF rendering are pushed to eventlet's native thread pool.
+import os
+
+from config import Config
+
+bind = f"{Config.FLASK_HOST}:{Config.FLASK_PORT}"
+
+# Flask-SocketIO is configured for eventlet, and gevent cannot share a
+# process with it
+worker_class = "eventlet"
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+
+# Keep one worker unless SocketIO gets a message queue: rooms and the
+# monitoring threads started in create_app() are per process
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+keepalive = 30
+timeout = 60
+graceful_timeout = 30
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
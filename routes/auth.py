@@ -1,10 +1,19 @@
-from flask import Flask, request, jsonify, g, Blueprint
+from flask import Flask, request, jsonify, g, Blueprint, Response
 import logging
+import threading
 import time
 
+from cachetools import TTLCache
+
+from utils.helpers import dumps_json
+
 auth_bp = Blueprint("auth", __name__, url_prefix="/auth")
 logger = logging.getLogger(__name__)
 
+# Load-balancer probes hit /auth/health every few seconds; ping the DB at most every 5s
+_health_cache = TTLCache(maxsize=1, ttl=5)
+_health_lock = threading.Lock()
+
 
 def init_auth_routes(app, database_service, mikrotik_manager, auth_service, subscription_service):
     """Initialize authentication, router connection, and subscription routes"""
@@ -45,7 +54,7 @@ def init_auth_routes(app, database_service, mikrotik_manager, auth_service, subs
             return jsonify({"success": False, "error": "Login failed"}), 500
 
     @auth_bp.route("/logout", methods=["POST"])
-    @auth_service_instance.auth_required
+    @auth_service_instance.secured()
     def logout():
         try:
             token = request.headers.get("Authorization", "").replace("Bearer ", "")
@@ -55,7 +64,7 @@ def init_auth_routes(app, database_service, mikrotik_manager, auth_service, subs
             return jsonify({"success": False, "error": "Logout failed"}), 500
 
     @auth_bp.route("/profile", methods=["GET"])
-    @auth_service_instance.auth_required
+    @auth_service_instance.secured()
     def get_profile():
         try:
             user_data = db.get_user_by_id(g.uid)
@@ -103,7 +112,7 @@ def init_auth_routes(app, database_service, mikrotik_manager, auth_service, subs
 
     # Router Management Routes
     @auth_bp.route("/router/connect", methods=["POST"])
-    @auth_service_instance.auth_required
+    @auth_service_instance.secured()
     def connect_router():
         try:
             data = request.get_json(silent=True) or {}
@@ -118,7 +127,7 @@ def init_auth_routes(app, database_service, mikrotik_manager, auth_service, subs
             return jsonify({"success": False, "error": "Router connection failed"}), 500
 
     @auth_bp.route("/routers", methods=["GET"])
-    @auth_service_instance.auth_required
+    @auth_service_instance.secured()
     def get_user_routers():
         try:
             return auth_service_instance.get_user_routers(db, g.uid)
@@ -127,7 +136,7 @@ def init_auth_routes(app, database_service, mikrotik_manager, auth_service, subs
             return jsonify({"success": False, "error": "Failed to retrieve routers"}), 500
 
     @auth_bp.route("/router/<router_name>/credentials", methods=["GET"])
-    @auth_service_instance.auth_required
+    @auth_service_instance.secured()
     def get_router_credentials(router_name):
         try:
             return auth_service_instance.get_router_credentials(db, g.uid, router_name)
@@ -136,7 +145,7 @@ def init_auth_routes(app, database_service, mikrotik_manager, auth_service, subs
             return jsonify({"success": False, "error": "Failed to retrieve router credentials"}), 500
 
     @auth_bp.route("/router/<router_name>/test", methods=["POST"])
-    @auth_service_instance.auth_required
+    @auth_service_instance.secured()
     def test_router_connection(router_name):
         try:
             router = db.get_router_credentials(g.uid, router_name)
@@ -152,7 +161,7 @@ def init_auth_routes(app, database_service, mikrotik_manager, auth_service, subs
 
     # Enhanced Subscription Routes with User Context
     @auth_bp.route("/subscription/generate", methods=["POST"])
-    @auth_service_instance.auth_required
+    @auth_service_instance.secured()
     def generate_subscription():
         try:
             data = request.get_json(silent=True) or {}
@@ -179,7 +188,7 @@ def init_auth_routes(app, database_service, mikrotik_manager, auth_service, subs
             return jsonify({"success": False, "error": "Failed to generate subscription codes"}), 500
 
     @auth_bp.route("/subscription/verify", methods=["POST"])
-    @auth_service_instance.auth_required
+    @auth_service_instance.secured()
     def verify_subscription():
         try:
             data = request.get_json(silent=True) or {}
@@ -202,7 +211,7 @@ def init_auth_routes(app, database_service, mikrotik_manager, auth_service, subs
             return jsonify({"success": False, "error": "Failed to verify subscription"}), 500
 
     @auth_bp.route("/subscription/status", methods=["GET"])
-    @auth_service_instance.auth_required
+    @auth_service_instance.secured()
     def check_subscription_status():
         try:
             return SubscriptionService.check_status(
@@ -214,7 +223,7 @@ def init_auth_routes(app, database_service, mikrotik_manager, auth_service, subs
             return jsonify({"success": False, "error": "Failed to check subscription status"}), 500
 
     @auth_bp.route("/subscriptions", methods=["GET"])
-    @auth_service_instance.auth_required
+    @auth_service_instance.secured()
     def get_user_subscriptions():
         try:
             return SubscriptionService.get_user_subscriptions(db, g.uid)
@@ -224,23 +233,33 @@ def init_auth_routes(app, database_service, mikrotik_manager, auth_service, subs
 
     # Admin-only routes
     @auth_bp.route("/admin/users", methods=["GET"])
-    @auth_service_instance.auth_required
-    @auth_service_instance.admin_required
+    @auth_service_instance.secured(admin=True)
     def get_all_users():
+        """Stream one keyset page of users as NDJSON; follow Link rel=next for more"""
         try:
-            users = db.get_all_users()
-            return auth_service_instance.standard_response(
-                True,
-                "Users retrieved successfully",
-                {"users": users, "count": len(users)}
-            )
+            after = request.args.get("after", 0, type=int)
+            limit = min(max(request.args.get("limit", 500, type=int), 1), 1000)
+
+            # The page is bounded by limit; only its serialization is streamed
+            users = list(db.iter_users(after, limit))
+
+            def generate():
+                for user in users:
+                    yield dumps_json(user) + b"\n"
+
+            response = Response(generate(), mimetype="application/x-ndjson")
+            response.headers["X-Total-Approx"] = str(db.approx_user_count())
+            if len(users) == limit:
+                response.headers["Link"] = (
+                    f'<{request.base_url}?after={users[-1]["id"]}&limit={limit}>; rel="next"'
+                )
+            return response
         except Exception as e:
             logger.exception("Error in /auth/admin/users")
             return jsonify({"success": False, "error": "Failed to retrieve users"}), 500
 
     @auth_bp.route("/admin/user/<user_id>/deactivate", methods=["POST"])
-    @auth_service_instance.auth_required
-    @auth_service_instance.admin_required
+    @auth_service_instance.secured(admin=True)
     def deactivate_user(user_id):
         try:
             success = db.deactivate_user(user_id)
@@ -257,8 +276,12 @@ def init_auth_routes(app, database_service, mikrotik_manager, auth_service, subs
     def health_check():
         try:
             # Test database connection
-            db_status = "healthy" if db.execute_query("SELECT 1", fetch_one=True) else "unhealthy"
-            
+            with _health_lock:
+                db_status = _health_cache.get("db_status")
+                if db_status is None:
+                    db_status = "healthy" if db.execute_query("SELECT 1", fetch_one=True) else "unhealthy"
+                    _health_cache["db_status"] = db_status
+
             return jsonify({
                 "success": True,
                 "status": "service is running",
@@ -273,10 +296,8 @@ def init_auth_routes(app, database_service, mikrotik_manager, auth_service, subs
                 "error": str(e)
             }), 500
 
-    # Add database service to app context for use in auth decorators
-    @app.before_request
-    def before_request():
-        g.database_service = db
+    # Expose the database service to the auth decorators
+    app.extensions.setdefault("db", db)
 
     app.register_blueprint(auth_bp)
     logger.info("Authentication routes initialized successfully")
\ No newline at end of file
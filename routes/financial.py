@@ -1,14 +1,53 @@
 from flask import Blueprint, request, jsonify
-from datetime import datetime, timedelta
 import logging
+import queue
+import threading
+
+from cachetools import TTLCache
+
 
 financial_bp = Blueprint("financial", __name__)
 logger = logging.getLogger(__name__)
 
+# Active-user snapshots are written to the DB off the request path
+_active_users_queue = queue.Queue(maxsize=1000)
+
+# Today's revenue only moves on sales; a few seconds of staleness is fine
+_revenue_cache = TTLCache(maxsize=1, ttl=15)
+_revenue_lock = threading.Lock()
+
+
+def _drain_active_users(database_service):
+    """Merge queued snapshots and record them in one batch"""
+    while True:
+        batch = [_active_users_queue.get()]
+        try:
+            while True:
+                batch.append(_active_users_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        # Later snapshots win for users seen more than once
+        merged = {}
+        for active_users in batch:
+            for u in active_users:
+                username = u.get("username") or u.get("user") or u.get("name")
+                if username:
+                    merged[username] = u
+
+        try:
+            database_service.record_active_users(list(merged.values()))
+        except Exception as e:
+            logger.error(f"Error recording active users: {e}")
+
 
 def init_financial_routes(app, database_service, mikrotik_manager):
     """Initialize financial routes"""
 
+    threading.Thread(
+        target=_drain_active_users, args=(database_service,), daemon=True
+    ).start()
+
     @financial_bp.route("/financial/stats")
     def get_financial_stats():
         try:
@@ -23,7 +62,7 @@ def init_financial_routes(app, database_service, mikrotik_manager):
     @financial_bp.route("/financial/active-revenue")
     def get_active_revenue():
         """
-        Fetch active MikroTik users, record them in DB, and return daily revenue + count.
+        Fetch active MikroTik users, queue them for recording, and return daily revenue + count.
         """
         try:
             # Step 1: Get live users from MikroTik
@@ -31,11 +70,21 @@ def init_financial_routes(app, database_service, mikrotik_manager):
                 mikrotik_manager.get_active_users() or []
             )  # [{username, profile_name, uptime}, ...]
 
-            # Step 2: Record & update users in DB (this automatically handles transactions)
-            database_service.record_active_users(active_users)
+            # Step 2: Queue the snapshot for the background writer
+            if active_users:
+                try:
+                    _active_users_queue.put_nowait(active_users)
+                except queue.Full:
+                    # The writer is behind; the next poll carries a fresher snapshot
+                    logger.warning("Active users queue full, dropping snapshot")
 
             # Step 3: Get today's total revenue (no args needed)
-            daily_revenue = database_service.calculate_daily_revenue()
+            with _revenue_lock:
+                daily_revenue = _revenue_cache.get("daily_revenue")
+            if daily_revenue is None:
+                daily_revenue = database_service.calculate_daily_revenue()
+                with _revenue_lock:
+                    _revenue_cache["daily_revenue"] = daily_revenue
 
             # Step 4: Respond
             return jsonify(
@@ -55,44 +104,8 @@ def init_financial_routes(app, database_service, mikrotik_manager):
         """
         try:
             days = int(request.args.get("days", 30))
-            # If database_service implements get_revenue_data, use it; otherwise compute manually
-            if hasattr(database_service, "get_revenue_data"):
-                rows = database_service.get_revenue_data(days) or []
-            else:
-                # Safe fallback query
-                rows = (
-                    database_service.execute_query(
-                        """
-                    SELECT DATE(transaction_date) AS date,
-                        SUM(amount) AS revenue,
-                        COUNT(DISTINCT voucher_code) AS voucher_count
-                    FROM financial_transactions
-                    WHERE transaction_type='SALE'
-                    AND transaction_date >= CURRENT_DATE - INTERVAL '%s days'
-                    GROUP BY DATE(transaction_date)
-                    ORDER BY date ASC
-                    """,
-                        (days,),
-                        fetch=True,
-                    )
-                    or []
-                )
-
-            # Normalize to full-day window, filling empty days with 0
-            data = []
-            row_map = {r["date"].strftime("%Y-%m-%d"): r for r in rows if r.get("date")}
-            for i in range(days):
-                date = (datetime.now() - timedelta(days=i)).strftime("%Y-%m-%d")
-                r = row_map.get(date, {"revenue": 0, "voucher_count": 0})
-                data.append(
-                    {
-                        "date": date,
-                        "revenue": r["revenue"] or 0,
-                        "voucher_count": r["voucher_count"] or 0,
-                    }
-                )
-
-            data.reverse()
+            data = database_service.get_revenue_series(days)
+
             return jsonify({"revenue_data": data})
         except Exception as e:
             logger.error(f"Error in /financial/revenue-data: {e}")
@@ -104,33 +117,9 @@ def init_financial_routes(app, database_service, mikrotik_manager):
         Return per-profile sales & revenue summary.
         """
         try:
-            rows = database_service.execute_query(
-                """
-    SELECT v.profile_name,
-        COUNT(v.voucher_code) AS total_created,
-        COUNT(ft.id) AS total_sold,
-        COALESCE(SUM(ft.amount), 0) AS total_revenue,
-        COUNT(CASE WHEN v.is_used = TRUE THEN 1 END) AS used_count
-    FROM vouchers v
-    LEFT JOIN financial_transactions ft
-        ON v.voucher_code = ft.voucher_code AND ft.transaction_type='SALE'
-    GROUP BY v.profile_name
-    ORDER BY total_sold DESC
-    """,
-                fetch=True,
-            )
-
-            profile_stats = [
-                {
-                    "profile_name": r["profile_name"],
-                    "total_sold": r["total_sold"],
-                    "total_revenue": r["total_revenue"] or 0,
-                    "used_count": r["used_count"],
-                }
-                for r in rows
-            ]
-
-            return jsonify({"profile_stats": profile_stats})
+            # Rows already carry the response shape with SQL-side defaults
+            rows = database_service.get_profile_stats()
+            return jsonify({"profile_stats": rows})
         except Exception as e:
             logger.error(f"Error in /financial/profile-stats: {e}")
             return jsonify({"error": str(e)}), 500
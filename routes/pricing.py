@@ -1,7 +1,16 @@
+import threading
+
+from cachetools import TTLCache
 from flask import Blueprint, request, jsonify
 
+from utils.helpers import etag_json
+
 pricing_bp = Blueprint('pricing', __name__)
 
+# Rates only change through PUT below, which clears this cache
+_rates_cache = TTLCache(maxsize=1, ttl=300)
+_rates_lock = threading.Lock()
+
 def init_pricing_routes(app, database_service):
     """Initialize pricing routes"""
     
@@ -9,14 +18,23 @@ def init_pricing_routes(app, database_service):
     def handle_pricing_rates():
         """Get or update pricing rates"""
         if request.method == "GET":
-            rates = database_service.get_pricing_rates()
-            return jsonify({"base_rates": rates})
+            with _rates_lock:
+                rates = _rates_cache.get("base_rates")
+            if rates is None:
+                rates = database_service.get_pricing_rates()
+                with _rates_lock:
+                    _rates_cache["base_rates"] = rates
+            return etag_json({"base_rates": rates})
         elif request.method == "PUT":
-            data = request.json
-            if 'base_rates' not in data:
+            data = request.json or {}
+            if not isinstance(data.get('base_rates'), dict) or not data['base_rates']:
                 return jsonify({"error": "base_rates is required"}), 400
-            
-            database_service.update_pricing_rates(data['base_rates'])
+
+            success = database_service.update_pricing_rates(data['base_rates'])
+            with _rates_lock:
+                _rates_cache.clear()
+            if not success:
+                return jsonify({"error": "Failed to update pricing rates"}), 500
             return jsonify({"message": "Pricing rates updated successfully"})
 
     # Register blueprint
@@ -1,60 +1,85 @@
+import threading
+
+from cachetools import TTLCache
 from flask import Blueprint, request, jsonify
 
 from models.schemas import Profile
+from services.auth_service import AuthService
+from services.voucher_service import VoucherService
+from utils.helpers import etag_json
 from utils.validators import validate_profile_name
 
 profiles_bp = Blueprint('profiles', __name__)
 
-def init_profiles_routes(app, database_service, mikrotik_manager):
+# Built profile listings keyed by view; each one costs a RouterOS round-trip
+_profiles_cache = TTLCache(maxsize=4, ttl=30)
+_profiles_lock = threading.Lock()
+
+
+def _cached_profiles(key, build):
+    """Return the listing cached under key, building it on a miss"""
+    with _profiles_lock:
+        profiles = _profiles_cache.get(key)
+    if profiles is None:
+        profiles = build()
+        with _profiles_lock:
+            _profiles_cache[key] = profiles
+    return profiles
+
+def init_profiles_routes(app, database_service, mikrotik_manager, mikrotik_snapshot):
     """Initialize profile routes"""
     
-    @profiles_bp.route("/profiles")
-    def get_profiles():
-        try:
-            profiles = mikrotik_manager.get_profiles()
+    def _build_profiles():
+        profiles = mikrotik_snapshot.get_profiles()
+        
+        # If no profiles from MikroTik, use default profiles from database
+        if not profiles:
+            db_profiles = database_service.get_all_profiles()
+            enhanced_profiles = []
+            for profile in db_profiles:
+                enhanced_profiles.append({
+                    'name': profile['name'],
+                    'rate-limit': profile['rate_limit'],
+                    'price': profile['price'],
+                    'time_limit': profile['time_limit'],
+                    'data_limit': profile['data_limit'],
+                    'uptime_limit': profile['uptime_limit']
+                })
+            return enhanced_profiles
+        
+        # Enhance profiles with pricing information (one query for all names)
+        db_profiles = database_service.get_profiles_by_names(
+            [profile.get('name', '') for profile in profiles]
+        )
+        enhanced_profiles = []
+        for profile in profiles:
+            profile_name = profile.get('name', '')
             
-            # If no profiles from MikroTik, use default profiles from database
-            if not profiles:
-                db_profiles = database_service.get_all_profiles()
-                enhanced_profiles = []
-                for profile in db_profiles:
-                    enhanced_profiles.append({
-                        'name': profile['name'],
-                        'rate-limit': profile['rate_limit'],
-                        'price': profile['price'],
-                        'time_limit': profile['time_limit'],
-                        'data_limit': profile['data_limit'],
-                        'uptime_limit': profile['uptime_limit']
-                    })
-                return jsonify({"profiles": enhanced_profiles})
+            # Get pricing from database
+            db_profile = db_profiles.get(profile_name)
             
-            # Enhance profiles with pricing information
-            enhanced_profiles = []
-            for profile in profiles:
-                profile_name = profile.get('name', '')
-                
-                # Get pricing from database
-                db_profile = database_service.get_profile(profile_name)
-                
-                if db_profile:
-                    profile['price'] = db_profile['price']
-                    profile['time_limit'] = db_profile['time_limit']
-                    profile['data_limit'] = db_profile['data_limit']
-                    profile['validity_period'] = db_profile['validity_period']
-                    profile['uptime_limit'] = db_profile['uptime_limit']
-                else:
-                    # Default values if not in database
-                    from services.voucher_service import VoucherService
-                    temp_service = VoucherService(None, database_service, None)
-                    profile['price'] = temp_service._calculate_price(profile_name)
-                    profile['time_limit'] = "24h"
-                    profile['data_limit'] = "Unlimited"
-                    profile['validity_period'] = 24
-                    profile['uptime_limit'] = "1d"
-                
-                enhanced_profiles.append(profile)
+            if db_profile:
+                profile['price'] = db_profile['price']
+                profile['time_limit'] = db_profile['time_limit']
+                profile['data_limit'] = db_profile['data_limit']
+                profile['validity_period'] = db_profile['validity_period']
+                profile['uptime_limit'] = db_profile['uptime_limit']
+            else:
+                # Default values if not in database
+                profile['price'] = VoucherService.calculate_price(profile_name)
+                profile['time_limit'] = "24h"
+                profile['data_limit'] = "Unlimited"
+                profile['validity_period'] = 24
+                profile['uptime_limit'] = "1d"
             
-            return jsonify({"profiles": enhanced_profiles})
+            enhanced_profiles.append(profile)
+        
+        return enhanced_profiles
+
+    @profiles_bp.route("/profiles")
+    def get_profiles():
+        try:
+            return etag_json({"profiles": _cached_profiles("profiles", _build_profiles)})
         except Exception as e:
             return jsonify({"profiles": []})
 
@@ -88,19 +113,23 @@ def init_profiles_routes(app, database_service, mikrotik_manager):
         if not success:
             return jsonify({"error": "Failed to add profile to database"}), 500
 
+        with _profiles_lock:
+            _profiles_cache.clear()
+
         return jsonify({"message": f"Profile '{profile_name}' added to database successfully"})
 
-    @profiles_bp.route("/profiles/enhanced")
-    def get_enhanced_profiles():
-        """Get profiles with enhanced information for the frontend"""
-        profiles = mikrotik_manager.get_profiles()
+    def _build_enhanced_profiles():
+        profiles = mikrotik_snapshot.get_profiles()
+        db_profiles = database_service.get_profiles_by_names(
+            [profile.get('name', '') for profile in profiles]
+        )
         enhanced_profiles = []
         
         for profile in profiles:
             profile_name = profile.get('name', '')
             
             # Get additional info from database
-            db_profile = database_service.get_profile(profile_name)
+            db_profile = db_profiles.get(profile_name)
             
             enhanced_profile = {
                 'name': profile_name,
@@ -113,7 +142,21 @@ def init_profiles_routes(app, database_service, mikrotik_manager):
             }
             enhanced_profiles.append(enhanced_profile)
         
-        return jsonify({"profiles": enhanced_profiles})
+        return enhanced_profiles
+
+    @profiles_bp.route("/profiles/refresh", methods=["POST"])
+    @AuthService.secured(admin=True)
+    def refresh_profiles():
+        """Re-read profiles and system info from MikroTik immediately"""
+        mikrotik_snapshot.refresh()
+        with _profiles_lock:
+            _profiles_cache.clear()
+        return jsonify({"message": "Profiles refreshed"})
+
+    @profiles_bp.route("/profiles/enhanced")
+    def get_enhanced_profiles():
+        """Get profiles with enhanced information for the frontend"""
+        return etag_json({"profiles": _cached_profiles("enhanced", _build_enhanced_profiles)})
 
     # Register blueprint
     app.register_blueprint(profiles_bp)
\ No newline at end of file
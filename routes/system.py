@@ -1,17 +1,16 @@
-from flask import Blueprint, jsonify
-from functools import lru_cache
+from flask import Blueprint
+
+from utils.helpers import etag_json
 
 system_bp = Blueprint('system', __name__)
 
-def init_system_routes(app, mikrotik_manager):
+def init_system_routes(app, mikrotik_snapshot):
     """Initialize system routes"""
     
-    @lru_cache(maxsize=1)
     @system_bp.route("/system/info")
     def get_system_info_route():
-        """Get MikroTik system information"""
-        system_info = mikrotik_manager.get_system_info()
-        return jsonify({"system_info": system_info})
+        """Get MikroTik system information from the background snapshot"""
+        return etag_json({"system_info": mikrotik_snapshot.get_system_info()})
 
     # Register blueprint
     app.register_blueprint(system_bp)
\ No newline at end of file
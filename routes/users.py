@@ -1,10 +1,30 @@
-from flask import Blueprint, request, jsonify, abort
-from utils.helpers import check_uptime_limit
+from flask import Blueprint, Response, request, jsonify, abort, stream_with_context
+from utils.helpers import (
+    cached_response,
+    check_uptime_limit,
+    dumps_json,
+    etag_json,
+)
 import math
-from functools import lru_cache
 
 users_bp = Blueprint("users", __name__)
 
+# Fixed parts of the list envelopes, in the sorted-key order dumps_json emits
+_ACTIVE_USERS_PREFIX = b'{"active_users":'
+_ALL_USERS_PREFIX = b'{"all_users":['
+_EXPIRED_USERS_PREFIX = b'{"expired_users":'
+_PAGINATION_INFIX = b',"pagination":'
+_LIST_PAGINATION_INFIX = b"]" + _PAGINATION_INFIX
+_SUFFIX = b"}"
+
+
+def _list_response(prefix: bytes, items, pagination) -> Response:
+    """{"<key>": items, "pagination": pagination} without building the outer dict"""
+    return Response(
+        prefix + dumps_json(items) + _PAGINATION_INFIX + dumps_json(pagination) + _SUFFIX,
+        mimetype="application/json",
+    )
+
 
 def init_users_routes(app, database_service, mikrotik_manager):
     """Initialize user routes"""
@@ -51,8 +71,8 @@ def init_users_routes(app, database_service, mikrotik_manager):
             },
         }
 
-    @lru_cache(maxsize=1)
     @users_bp.route("/active-users")
+    @cached_response(ttl=10)
     def get_active_users():
         """Get active users with pagination"""
         # Get pagination parameters with defaults
@@ -72,14 +92,14 @@ def init_users_routes(app, database_service, mikrotik_manager):
             active_users, page, per_page, "get_active_users"
         )
 
-        return jsonify(
-            {
-                "active_users": paginated_result["data"],
-                "pagination": paginated_result["pagination"],
-            }
+        return _list_response(
+            _ACTIVE_USERS_PREFIX,
+            paginated_result["data"],
+            paginated_result["pagination"],
         )
 
     @users_bp.route("/all-users")
+    @cached_response(ttl=10)
     def get_all_users():
         """Get all users from database (synced from MikroTik) efficiently with pagination"""
         # Get pagination parameters with defaults
@@ -92,41 +112,50 @@ def init_users_routes(app, database_service, mikrotik_manager):
         if per_page < 1 or per_page > 500:
             return jsonify({"error": "per_page must be between 1 and 500"}), 400
 
-        rows = database_service.get_all_users()
+        # Paginate in SQL so only the requested page is read
+        total = database_service.count_all_users()
+        pages = math.ceil(total / per_page)
+        if page > pages and pages > 0:
+            page = pages
+        pagination = {
+            "page": page,
+            "per_page": per_page,
+            "total": total,
+            "pages": pages,
+            "has_prev": total > 0 and page > 1,
+            "has_next": page < pages,
+        }
+        rows = database_service.get_all_users_json(per_page, (page - 1) * per_page)
 
-        # Fetch all usage data from MikroTik in bulk
-        all_usage = (
-            mikrotik_manager.get_all_users_usage()
+        # Fetch usage for the page from MikroTik in one call
+        all_usage = mikrotik_manager.get_bulk_user_usage(
+            [row["username"] for row in rows]
         )  # returns {username: usage_dict}
 
-        users = []
-        for row in rows:
-            usage = all_usage.get(row["username"], {})
-            users.append(
-                {
-                    "username": row["username"],
-                    "profile_name": row["profile_name"],
-                    "is_active": bool(row["is_active"]),
-                    "last_seen": row["last_seen"],
-                    "uptime_limit": row["uptime_limit"],
-                    "comment": row["comment"],
-                    "password_type": row["password_type"],
-                    "is_voucher": bool(row["is_voucher"]),
-                    "current_uptime": usage.get("uptime", "0s"),
-                    "bytes_used": (
-                        usage.get("bytes_in", 0) + usage.get("bytes_out", 0)
-                    ),
-                }
-            )
-
-        # Paginate the results
-        paginated_result = paginate_results(users, page, per_page, "get_all_users")
-
-        return jsonify(
-            {
-                "all_users": paginated_result["data"],
-                "pagination": paginated_result["pagination"],
-            }
+        def generate():
+            # Rows arrive as JSON objects from PostgreSQL; only the two
+            # MikroTik usage fields are spliced in before the closing brace
+            yield _ALL_USERS_PREFIX
+            for index, row in enumerate(rows):
+                usage = all_usage.get(row["username"], {})
+                extra = dumps_json(
+                    {
+                        "current_uptime": usage.get("uptime", "0s"),
+                        "bytes_used": (
+                            usage.get("bytes_in", 0) + usage.get("bytes_out", 0)
+                        ),
+                    }
+                )
+                yield (
+                    (b"," if index else b"")
+                    + row["doc"].rstrip()[:-1].encode("utf-8")
+                    + b","
+                    + extra[1:]
+                )
+            yield _LIST_PAGINATION_INFIX + dumps_json(pagination) + _SUFFIX
+
+        return Response(
+            stream_with_context(generate()), mimetype="application/json"
         )
 
     @users_bp.route("/users/expired")
@@ -144,14 +173,18 @@ def init_users_routes(app, database_service, mikrotik_manager):
 
         rows = database_service.get_expired_users()
 
-        # Bulk fetch usage
-        expired_usernames = [row["username"] for row in rows]
+        # Paginate first so only the requested page is built
+        paginated_result = paginate_results(
+            rows, page, per_page, "get_expired_users"
+        )
+
+        # Bulk fetch usage for the page
         usage_data = mikrotik_manager.get_bulk_user_usage(
-            expired_usernames
+            [row["username"] for row in paginated_result["data"]]
         )  # returns {username: usage_dict}
 
         expired_users = []
-        for row in rows:
+        for row in paginated_result["data"]:
             usage = usage_data.get(row["username"], {})
             expired_users.append(
                 {
@@ -165,16 +198,8 @@ def init_users_routes(app, database_service, mikrotik_manager):
                 }
             )
 
-        # Paginate the results
-        paginated_result = paginate_results(
-            expired_users, page, per_page, "get_expired_users"
-        )
-
-        return jsonify(
-            {
-                "expired_users": paginated_result["data"],
-                "pagination": paginated_result["pagination"],
-            }
+        return _list_response(
+            _EXPIRED_USERS_PREFIX, expired_users, paginated_result["pagination"]
         )
 
     @users_bp.route("/users/<username>")
@@ -192,7 +217,9 @@ def init_users_routes(app, database_service, mikrotik_manager):
             else False
         )
 
-        return jsonify(
+        # Re-polled by the admin UI; unchanged users (including live usage)
+        # answer 304
+        return etag_json(
             {
                 "username": result["username"],
                 "profile_name": result["profile_name"],
@@ -204,9 +231,21 @@ def init_users_routes(app, database_service, mikrotik_manager):
                 "is_voucher": bool(result["is_voucher"]),
                 "current_usage": usage,
                 "is_expired": is_expired,
-            }
+            },
+            max_age=0,
         )
 
+    def apply_comments(updates):
+        """Write comments to MikroTik, then mirror the applied ones to the DB"""
+        updated = set(mikrotik_manager.update_user_comments(updates))
+        applied = [(c, u) for u, c in updates if u in updated]
+        if applied:
+            database_service.execute_query(
+                "UPDATE all_users SET comment=%s WHERE username=%s",
+                batch_data=applied,
+            )
+        return updated
+
     @users_bp.route("/users/<username>/comment", methods=["PUT"])
     def update_user_comment(username):
         """Update user comment in both MikroTik and database"""
@@ -216,17 +255,36 @@ def init_users_routes(app, database_service, mikrotik_manager):
         if not comment:
             return jsonify({"error": "comment is required"}), 400
 
-        # Update in MikroTik
-        success = mikrotik_manager.update_user_comment(username, comment)
-        if not success:
+        if not apply_comments([(username, comment)]):
             return jsonify({"error": "Failed to update comment in MikroTik"}), 500
 
-        # Update in database
-        database_service.execute_query(
-            "UPDATE all_users SET comment=%s WHERE username=%s", (comment, username)
-        )
-
         return jsonify({"message": "Comment updated successfully"})
 
+    @users_bp.route("/users/comments", methods=["PUT"])
+    def update_user_comments():
+        """Update comments for several users: [{"username": ..., "comment": ...}]"""
+        data = request.json
+        if not isinstance(data, list) or not data:
+            return jsonify({"error": "Expected a non-empty JSON array"}), 400
+
+        updates = []
+        for item in data:
+            if not isinstance(item, dict) or not item.get("username"):
+                return jsonify({"error": "Each entry needs a username"}), 400
+            if not item.get("comment"):
+                return jsonify({"error": "comment is required"}), 400
+            updates.append((item["username"], item["comment"]))
+
+        updated = apply_comments(updates)
+        failed = [u for u, _ in updates if u not in updated]
+
+        return jsonify(
+            {
+                "message": f"Updated {len(updated)} comments",
+                "updated": [u for u, _ in updates if u in updated],
+                "failed": failed,
+            }
+        )
+
     # Register blueprint
     app.register_blueprint(users_bp)
@@ -1,12 +1,61 @@
-from flask import Blueprint, request, jsonify, abort, send_file
+from flask import Blueprint, request, jsonify, abort, send_file, url_for
 from typing import Dict, Any
 import os
 from pathlib import Path
 
 from services.voucher_service import VoucherService
+from utils.helpers import etag_json
 
 vouchers_bp = Blueprint("vouchers", __name__)
 
+# How each password type is shown on printed vouchers
+PASSWORD_DISPLAY = {
+    "same": "same as username",
+    "custom": "custom password",
+    "blank": "blank",
+}
+
+
+def _normalize_voucher(voucher_info: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize voucher info to the structure the PDF generators expect"""
+    password_type = voucher_info.get("password_type", "blank")
+    return {
+        "code": voucher_info.get("code") or voucher_info.get("voucher_code"),
+        "profile": voucher_info.get("profile") or voucher_info.get("profile_name"),
+        "uptime_limit": voucher_info.get("uptime_limit"),
+        "password_type": password_type,
+        "expiry_time": voucher_info.get("expiry_time"),
+        "customer_name": voucher_info.get("customer_name", ""),
+        "customer_contact": voucher_info.get("customer_contact", ""),
+        "price": voucher_info.get("price", 0),
+        "is_used": voucher_info.get("is_used", False),
+        "password": PASSWORD_DISPLAY.get(password_type, "blank"),
+    }
+
+
+def _send_pdf(pdf_path: str, filename: str, error: str):
+    """Send a generated PDF, letting send_file's own stat detect a missing file"""
+    try:
+        return send_file(
+            pdf_path,
+            as_attachment=True,
+            download_name=filename,
+            mimetype="application/pdf",
+            conditional=True,
+        )
+    except FileNotFoundError:
+        return jsonify({"error": error}), 500
+
+
+def _pdf_job_accepted(job_id: str):
+    """202 response pointing at the job's status endpoint"""
+    status_url = url_for("vouchers.get_pdf_job", job_id=job_id)
+    return (
+        jsonify({"job_id": job_id, "status": "queued", "status_url": status_url}),
+        202,
+        {"Location": status_url},
+    )
+
 
 def init_vouchers_routes(app, voucher_service: VoucherService):
     """Initialize voucher routes with the service"""
@@ -33,11 +82,8 @@ def init_vouchers_routes(app, voucher_service: VoucherService):
         if not success:
             return jsonify({"error": message}), 400
 
-        total_price = sum(
-            voucher_service.db.get_profile(voucher["profile"]).get("price", 1000)
-            for voucher in vouchers
-            if voucher_service.db.get_profile(voucher["profile"])
-        )
+        # create_vouchers stamps each voucher with its profile's price
+        total_price = sum(voucher["price"] for voucher in vouchers)
 
         response_data = {
             "vouchers": vouchers,
@@ -50,12 +96,13 @@ def init_vouchers_routes(app, voucher_service: VoucherService):
             if pdf_vouchers:
                 response_data["pdf_generated"] = True
                 response_data["individual_pdfs"] = [
-                    v["pdf_path"] for v in pdf_vouchers if "pdf_path" in v
+                    v["pdf_path"] for v in pdf_vouchers
                 ]
 
+                # Ordered dedup so batch_pdf is the first batch file produced
                 batch_pdfs = list(
-                    set(
-                        [v["batch_pdf_path"] for v in vouchers if "batch_pdf_path" in v]
+                    dict.fromkeys(
+                        v["batch_pdf_path"] for v in vouchers if "batch_pdf_path" in v
                     )
                 )
                 if batch_pdfs:
@@ -72,7 +119,8 @@ def init_vouchers_routes(app, voucher_service: VoucherService):
         if not success:
             abort(404, description=message)
 
-        return jsonify(voucher_info)
+        # Re-polled by the admin UI; unchanged vouchers answer 304
+        return etag_json(voucher_info, max_age=0)
 
     @vouchers_bp.route("/vouchers/expired")
     def get_expired_vouchers_endpoint():
@@ -92,25 +140,28 @@ def init_vouchers_routes(app, voucher_service: VoucherService):
 
         # Determine PDF style from query parameter
         pdf_style = request.args.get("style", "standard")  # standard, card, batch
+        if pdf_style == "card":
+            render = voucher_service.generate_voucher_card_pdf
+        else:
+            render = voucher_service.generate_single_voucher_pdf
+
+        # ?async=true renders in the background; poll the returned status_url
+        if request.args.get("async", "false").lower() == "true":
+            job_id = voucher_service.submit_pdf_job(render, voucher_info)
+            return _pdf_job_accepted(job_id)
 
         try:
-            if pdf_style == "card":
-                pdf_path = voucher_service.generate_voucher_card_pdf(voucher_info)
-            else:
-                pdf_path = voucher_service.generate_single_voucher_pdf(voucher_info)
+            pdf_path = voucher_service.render_pdf(render, voucher_info)
 
-            if not pdf_path or not os.path.exists(pdf_path):
+            if not pdf_path:
                 return jsonify({"error": "PDF generation failed"}), 500
 
             # Return PDF file or path based on request
             if request.args.get("download", "true").lower() == "true":
                 filename = f"voucher_{voucher_code}.pdf"
-                return send_file(
-                    pdf_path,
-                    as_attachment=True,
-                    download_name=filename,
-                    mimetype="application/pdf",
-                )
+                return _send_pdf(pdf_path, filename, "PDF generation failed")
+            elif not os.path.exists(pdf_path):
+                return jsonify({"error": "PDF generation failed"}), 500
             else:
                 return jsonify(
                     {
@@ -132,62 +183,47 @@ def init_vouchers_routes(app, voucher_service: VoucherService):
         if not voucher_codes:
             return jsonify({"error": "No voucher codes provided"}), 400
 
-        # Get voucher information for all codes
-        vouchers_data = []
-        for code in voucher_codes:
-            success, voucher_info, message = voucher_service.get_voucher_info(code)
-            if success:
-                # NORMALIZE THE DATA STRUCTURE - Same as single voucher route
-                normalized_voucher = {
-                    "code": voucher_info.get("code")
-                    or voucher_info.get("voucher_code"),
-                    "profile": voucher_info.get("profile")
-                    or voucher_info.get("profile_name"),
-                    "uptime_limit": voucher_info.get("uptime_limit"),
-                    "password_type": voucher_info.get("password_type", "blank"),
-                    "expiry_time": voucher_info.get("expiry_time"),
-                    "customer_name": voucher_info.get("customer_name", ""),
-                    "customer_contact": voucher_info.get("customer_contact", ""),
-                    "price": voucher_info.get("price", 0),
-                    "is_used": voucher_info.get("is_used", False),
-                }
-
-                # Determine password display based on password type
-                password_type = normalized_voucher["password_type"]
-                if password_type == "same":
-                    normalized_voucher["password"] = "same as username"
-                elif password_type == "custom":
-                    normalized_voucher["password"] = "custom password"
-            else:  # blank
-                normalized_voucher["password"] = "blank"
-
-            vouchers_data.append(normalized_voucher)
+        # Get voucher information for all codes in one round of lookups,
+        # keeping the requested order and dropping unknown codes
+        voucher_infos = voucher_service.get_vouchers_info_bulk(voucher_codes)
+        vouchers_data = [
+            _normalize_voucher(voucher_infos[code])
+            for code in voucher_codes
+            if voucher_infos.get(code)
+        ]
 
         if not vouchers_data:
             return jsonify({"error": "No valid vouchers found"}), 404
 
+        # Use the first voucher's profile for batch naming
+        profile_name = vouchers_data[0].get("profile", "batch")
+        customer_name = vouchers_data[0].get("customer_name", "")
+
+        if request.args.get("async", "false").lower() == "true":
+            job_id = voucher_service.submit_pdf_job(
+                voucher_service.generate_batch_vouchers_pdf,
+                vouchers_data,
+                profile_name,
+                customer_name,
+            )
+            return _pdf_job_accepted(job_id)
+
         try:
-            # Use the first voucher's profile for batch naming
-            profile_name = vouchers_data[0].get(
-                "profile", "batch"
-            )  # Changed to "profile"
-            customer_name = vouchers_data[0].get("customer_name", "")
-
-            pdf_path = voucher_service.generate_batch_vouchers_pdf(
-                vouchers_data, profile_name, customer_name
+            pdf_path = voucher_service.render_pdf(
+                voucher_service.generate_batch_vouchers_pdf,
+                vouchers_data,
+                profile_name,
+                customer_name,
             )
 
-            if not pdf_path or not os.path.exists(pdf_path):
+            if not pdf_path:
                 return jsonify({"error": "Batch PDF generation failed"}), 500
 
             if request.args.get("download", "true").lower() == "true":
                 filename = f"batch_vouchers_{len(vouchers_data)}_{profile_name}.pdf"
-                return send_file(
-                    pdf_path,
-                    as_attachment=True,
-                    download_name=filename,
-                    mimetype="application/pdf",
-                )
+                return _send_pdf(pdf_path, filename, "Batch PDF generation failed")
+            elif not os.path.exists(pdf_path):
+                return jsonify({"error": "Batch PDF generation failed"}), 500
             else:
                 return jsonify(
                     {
@@ -201,6 +237,22 @@ def init_vouchers_routes(app, voucher_service: VoucherService):
         except Exception as e:
             return jsonify({"error": f"Batch PDF generation failed: {str(e)}"}), 500
 
+    @vouchers_bp.route("/vouchers/pdf/jobs/<job_id>")
+    def get_pdf_job(job_id):
+        """Status of a background PDF job; ?download=true sends the finished file"""
+        job = voucher_service.get_pdf_job(job_id)
+        if not job:
+            abort(404, description="PDF job not found")
+
+        if job["status"] == "done" and request.args.get("download") == "true":
+            return _send_pdf(
+                job["pdf_path"],
+                os.path.basename(job["pdf_path"]),
+                "PDF file no longer exists",
+            )
+
+        return jsonify(job)
+
     @vouchers_bp.route("/vouchers/pdf/list")
     def list_generated_pdfs():
         """List all generated PDF files"""
@@ -209,15 +261,20 @@ def init_vouchers_routes(app, voucher_service: VoucherService):
             pdf_files = []
 
             if pdf_dir.exists():
-                for pdf_file in pdf_dir.glob("*.pdf"):
-                    pdf_files.append(
-                        {
-                            "filename": pdf_file.name,
-                            "path": str(pdf_file),
-                            "size": pdf_file.stat().st_size,
-                            "created": pdf_file.stat().st_ctime,
-                        }
-                    )
+                # One stat per entry; DirEntry caches it for both fields
+                with os.scandir(pdf_dir) as entries:
+                    for entry in entries:
+                        if not entry.name.endswith(".pdf") or not entry.is_file():
+                            continue
+                        stat = entry.stat()
+                        pdf_files.append(
+                            {
+                                "filename": entry.name,
+                                "path": str(pdf_dir / entry.name),
+                                "size": stat.st_size,
+                                "created": stat.st_ctime,
+                            }
+                        )
 
             return jsonify(
                 {
@@ -232,35 +289,26 @@ def init_vouchers_routes(app, voucher_service: VoucherService):
 
     @vouchers_bp.route("/vouchers/pdf/cleanup", methods=["POST"])
     def cleanup_pdfs():
-        """Clean up generated PDF files (optional)"""
-        try:
-            data = request.json or {}
-            older_than_days = data.get(
-                "older_than_days", 7
-            )  # Default: clean up files older than 7 days
-
-            pdf_dir = voucher_service.pdf_output_dir
-            deleted_files = []
-
-            if pdf_dir.exists():
-                import time
-
-                current_time = time.time()
-                cutoff_time = current_time - (older_than_days * 24 * 60 * 60)
-
-                for pdf_file in pdf_dir.glob("*.pdf"):
-                    if pdf_file.stat().st_ctime < cutoff_time:
-                        pdf_file.unlink()
-                        deleted_files.append(pdf_file.name)
+        """Start a cleanup of generated PDF files in the background"""
+        data = request.json or {}
+        # Default: clean up files older than 7 days
+        older_than_days = data.get("older_than_days", 7)
+        if not isinstance(older_than_days, (int, float)) or older_than_days < 0:
+            return (
+                jsonify({"error": "older_than_days must be a non-negative number"}),
+                400,
+            )
 
-            return jsonify(
+        voucher_service.submit_pdf_cleanup(older_than_days)
+        return (
+            jsonify(
                 {
-                    "message": f"Cleaned up {len(deleted_files)} PDF files",
-                    "deleted_files": deleted_files,
+                    "message": "PDF cleanup started",
+                    "older_than_days": older_than_days,
                 }
-            )
-        except Exception as e:
-            return jsonify({"error": f"PDF cleanup failed: {str(e)}"}), 500
+            ),
+            202,
+        )
 
     # Register blueprint
     app.register_blueprint(vouchers_bp)
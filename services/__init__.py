@@ -1,5 +1,5 @@
 
-from .mikrotik_manager import MikroTikManager
+from .mikrotik_manager import MikroTikManager, MikroTikSnapshot
 from .database_service import DatabaseService
 from .voucher_service import VoucherService
 from .monitoring_service import MonitoringService
@@ -8,6 +8,7 @@ from .auth_service import AuthService
 
 __all__ = [
     'MikroTikManager',
+    'MikroTikSnapshot',
     'DatabaseService',
     'VoucherService', 
     'MonitoringService',
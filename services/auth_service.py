@@ -1,16 +1,29 @@
 import os
 import time
+import hashlib
+import threading
 import random
 import bcrypt
 import jwt
 import logging
 from functools import wraps
-from flask import request, jsonify, g
+from flask import request, jsonify, g, current_app
 from dotenv import load_dotenv
 from twilio.rest import Client
 from flask_limiter.util import get_remote_address
+from cachetools import TTLCache
 from typing import Dict, Any, Optional, List
 
+
+try:
+    from eventlet import tpool
+    from eventlet.patcher import is_monkey_patched
+
+    # Under eventlet a C-level bcrypt call would stall every greenlet in the process
+    BCRYPT_OFFLOAD = is_monkey_patched("thread")
+except ImportError:
+    BCRYPT_OFFLOAD = False
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -40,6 +53,49 @@ BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
 JWT_EXPIRY_HOURS = int(os.getenv("JWT_EXPIRY_HOURS", "24"))
 SESSION_TIMEOUT_HOURS = int(os.getenv("SESSION_TIMEOUT_HOURS", "1"))
 
+# JWT parameters are fixed for the process; the HMAC key is passed as bytes
+# so PyJWT does not re-encode the secret on every encode/decode
+JWT_ALGORITHM = "HS256"
+_JWT_ALGORITHMS = [JWT_ALGORITHM]
+_JWT_KEY = JWT_SECRET_KEY.encode("utf-8")
+JWT_ISSUER = "mikrotik-auth-service"
+JWT_AUDIENCE = "mikrotik-management-app"
+
+# Verified tokens: blake2b(token) -> (uid, role, exp). Only successful
+# verifications are stored. Logout and password reset evict entries in this
+# process; a session revoked by another worker keeps working here for at most
+# the TTL.
+_token_cache = TTLCache(maxsize=10_000, ttl=30)
+_token_cache_lock = threading.Lock()
+
+
+def _token_key(token: str) -> bytes:
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+# Successful bcrypt checks, keyed by a per-process keyed digest of
+# (hash, candidate) so plaintext passwords are never held in memory.
+# Failed checks are not cached and always pay the full bcrypt cost.
+_password_cache = TTLCache(maxsize=10_000, ttl=60)
+_password_cache_lock = threading.Lock()
+_PASSWORD_CACHE_KEY = os.urandom(32)
+
+
+def _bcrypt(fn, *args):
+    """Run a bcrypt call on a native worker thread when running green"""
+    if BCRYPT_OFFLOAD:
+        return tpool.execute(fn, *args)
+    return fn(*args)
+
+
+def _password_key(password: str, hashed: str) -> bytes:
+    h = hashlib.blake2b(key=_PASSWORD_CACHE_KEY, digest_size=32)
+    h.update(hashed.encode("utf-8"))
+    h.update(b"\0")
+    h.update(password.encode("utf-8"))
+    return h.digest()
+
+
 # Twilio client
 twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
 
@@ -60,10 +116,10 @@ class AuthService:
             "role": role,
             "iat": now,
             "exp": now + expire_seconds,
-            "iss": "mikrotik-auth-service",
-            "aud": "mikrotik-management-app",
+            "iss": JWT_ISSUER,
+            "aud": JWT_AUDIENCE,
         }
-        token = jwt.encode(payload, JWT_SECRET_KEY, algorithm="HS256")
+        token = jwt.encode(payload, _JWT_KEY, algorithm=JWT_ALGORITHM)
         return token if isinstance(token, str) else token.decode("utf-8")
 
     @staticmethod
@@ -72,10 +128,10 @@ class AuthService:
         try:
             payload = jwt.decode(
                 token,
-                JWT_SECRET_KEY,
-                algorithms=["HS256"],
-                audience="mikrotik-management-app",
-                issuer="mikrotik-auth-service",
+                _JWT_KEY,
+                algorithms=_JWT_ALGORITHMS,
+                audience=JWT_AUDIENCE,
+                issuer=JWT_ISSUER,
             )
             return payload
         except jwt.ExpiredSignatureError:
@@ -89,61 +145,102 @@ class AuthService:
             return {"error": "Token verification failed", "code": "VERIFICATION_FAILED"}
 
     @staticmethod
-    def auth_required(fn):
-        """Enhanced decorator to protect routes with JWT and session validation"""
-
-        @wraps(fn)
-        def wrapper(*args, **kwargs):
-            token = request.headers.get("Authorization", "").replace("Bearer ", "")
-            if not token:
-                return (
-                    jsonify(
-                        {
-                            "success": False,
-                            "error": "Missing authentication token",
-                            "code": "MISSING_TOKEN",
-                        }
-                    ),
-                    401,
-                )
-
-            # Validate JWT
-            payload = AuthService.verify_jwt(token)
-            if "error" in payload:
-                return (
-                    jsonify(
-                        {
-                            "success": False,
-                            "error": payload["error"],
-                            "code": payload.get("code", "AUTH_ERROR"),
-                        }
-                    ),
-                    401,
-                )
+    def secured(admin: bool = False):
+        """
+        Decorator factory protecting routes with JWT and session validation.
+        admin=True also requires the admin role, in the same wrapper frame
+        instead of stacking admin_required on top.
+        """
+
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                token = request.headers.get("Authorization", "").replace("Bearer ", "")
+                if not token:
+                    return (
+                        jsonify(
+                            {
+                                "success": False,
+                                "error": "Missing authentication token",
+                                "code": "MISSING_TOKEN",
+                            }
+                        ),
+                        401,
+                    )
 
-            # Validate session in database (if database_service available)
-            if hasattr(g, "database_service"):
-                session = g.database_service.validate_session(token)
-                if not session:
+                key = _token_key(token)
+                with _token_cache_lock:
+                    cached = _token_cache.get(key)
+                if cached is not None and cached[2] > time.time():
+                    g.uid, g.role, _ = cached
+                    g.token = token
+                    if admin and g.role != "admin":
+                        return AuthService._admin_required_response()
+                    return fn(*args, **kwargs)
+
+                # Validate JWT
+                payload = AuthService.verify_jwt(token)
+                if "error" in payload:
                     return (
                         jsonify(
                             {
                                 "success": False,
-                                "error": "Invalid or expired session",
-                                "code": "INVALID_SESSION",
+                                "error": payload["error"],
+                                "code": payload.get("code", "AUTH_ERROR"),
                             }
                         ),
                         401,
                     )
 
-            # Set user context
-            g.uid = payload["sub"]
-            g.role = payload.get("role", "user")
-            g.token = token
+                # Validate session in database (if database_service available)
+                database_service = current_app.extensions.get("db")
+                if database_service is not None:
+                    session = database_service.validate_session(token)
+                    if not session:
+                        return (
+                            jsonify(
+                                {
+                                    "success": False,
+                                    "error": "Invalid or expired session",
+                                    "code": "INVALID_SESSION",
+                                }
+                            ),
+                            401,
+                        )
+
+                # Set user context
+                g.uid = payload["sub"]
+                g.role = payload.get("role", "user")
+                g.token = token
+
+                with _token_cache_lock:
+                    _token_cache[key] = (g.uid, g.role, payload["exp"])
+
+                if admin and g.role != "admin":
+                    return AuthService._admin_required_response()
+                return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
 
-            return fn(*args, **kwargs)
+    @staticmethod
+    def auth_required(fn):
+        """Enhanced decorator to protect routes with JWT and session validation"""
+        return AuthService.secured()(fn)
 
-        return wrapper
+    @staticmethod
+    def _admin_required_response():
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "error": "Administrator access required",
+                    "code": "ADMIN_REQUIRED",
+                }
+            ),
+            403,
+        )
 
     @staticmethod
     def admin_required(fn):
@@ -152,16 +249,7 @@ class AuthService:
         @wraps(fn)
         def wrapper(*args, **kwargs):
             if not hasattr(g, "role") or g.role != "admin":
-                return (
-                    jsonify(
-                        {
-                            "success": False,
-                            "error": "Administrator access required",
-                            "code": "ADMIN_REQUIRED",
-                        }
-                    ),
-                    403,
-                )
+                return AuthService._admin_required_response()
             return fn(*args, **kwargs)
 
         return wrapper
@@ -190,8 +278,9 @@ class AuthService:
                 )
 
             # Check if user has access to this router
-            if hasattr(g, "database_service") and hasattr(g, "uid"):
-                router = g.database_service.get_router_credentials(g.uid, router_name)
+            database_service = current_app.extensions.get("db")
+            if database_service is not None and hasattr(g, "uid"):
+                router = database_service.get_router_credentials(g.uid, router_name)
                 if not router:
                     return (
                         jsonify(
@@ -212,15 +301,27 @@ class AuthService:
     @staticmethod
     def hash_password(password: str) -> str:
         """Hash a password using bcrypt with configurable rounds"""
-        return bcrypt.hashpw(
-            password.encode("utf-8"), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+        return _bcrypt(
+            bcrypt.hashpw,
+            password.encode("utf-8"),
+            bcrypt.gensalt(rounds=BCRYPT_ROUNDS),
         ).decode("utf-8")
 
     @staticmethod
     def verify_password(password: str, hashed: str) -> bool:
         """Verify bcrypt password"""
         try:
-            return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+            key = _password_key(password, hashed)
+            with _password_cache_lock:
+                if key in _password_cache:
+                    return True
+            valid = _bcrypt(
+                bcrypt.checkpw, password.encode("utf-8"), hashed.encode("utf-8")
+            )
+            if valid:
+                with _password_cache_lock:
+                    _password_cache[key] = True
+            return valid
         except Exception as e:
             logger.error(f"Password verification error: {str(e)}")
             return False
@@ -354,9 +455,30 @@ class AuthService:
             },
         )
 
+    @staticmethod
+    def invalidate_token(token: str):
+        """Drop a cached verification so the token is fully re-checked"""
+        with _token_cache_lock:
+            _token_cache.pop(_token_key(token), None)
+
+    @staticmethod
+    def invalidate_user_tokens(uid: str):
+        """Drop cached verifications for every token belonging to uid
+
+        uid is the public users.user_id, the same id create_jwt puts in "sub".
+        """
+        uid = str(uid)
+        with _token_cache_lock:
+            stale = [
+                key for key, cached in _token_cache.items() if str(cached[0]) == uid
+            ]
+            for key in stale:
+                _token_cache.pop(key, None)
+
     @staticmethod
     def logout_user(database_service, token: str):
         """Logout user by invalidating session"""
+        AuthService.invalidate_token(token)
         success = database_service.invalidate_session(token)
         if success:
             logger.info("User logged out successfully")
@@ -509,6 +631,7 @@ class AuthService:
             # Mark token as used and invalidate all sessions
             database_service.use_password_reset_token(token)
             database_service.invalidate_all_user_sessions(reset_data["user_id"])
+            AuthService.invalidate_user_tokens(reset_data["user_id"])
 
             logger.info(f"Password reset successful for user: {reset_data['user_id']}")
             return AuthService.standard_response(True, "Password reset successfully")
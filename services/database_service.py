@@ -1,5 +1,7 @@
 import psycopg2
-from psycopg2.extras import RealDictCursor, execute_batch
+from psycopg2.extras import RealDictCursor, execute_batch, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from cachetools import TTLCache
 import logging
 from typing import List, Dict, Any, Optional
 import threading
@@ -16,53 +18,176 @@ import random
 
 logger = logging.getLogger(__name__)
 
+# Financial queries run on every dashboard refresh and user lookups on every
+# detail poll; prepared once per connection
+PREPARED_STATEMENTS = {
+    "ps_financial_stats": """
+        PREPARE ps_financial_stats AS
+        SELECT
+            (SELECT COALESCE(SUM(revenue),0) FROM daily_revenue) as total_revenue,
+            (SELECT COALESCE(SUM(revenue),0) FROM daily_revenue WHERE date=CURRENT_DATE) as daily_revenue,
+            (SELECT COUNT(*) FROM vouchers WHERE is_used=FALSE) as active_vouchers,
+            (SELECT COUNT(*) FROM vouchers WHERE is_used=TRUE AND DATE(activated_at)=CURRENT_DATE) as used_today,
+            (SELECT COUNT(*) FROM all_users WHERE DATE(activated_at)=CURRENT_DATE) as daily_activations
+    """,
+    "ps_daily_revenue": """
+        PREPARE ps_daily_revenue AS
+        SELECT COALESCE(SUM(revenue), 0) AS total
+        FROM daily_revenue
+        WHERE date = CURRENT_DATE
+    """,
+    # Every day in the window (oldest first), zero-filled where nothing sold
+    "ps_revenue_series": """
+        PREPARE ps_revenue_series(integer) AS
+        SELECT d.date::date::text AS date,
+            COALESCE(dr.revenue, 0) AS revenue,
+            COALESCE(dr.voucher_count, 0) AS voucher_count
+        FROM generate_series(CURRENT_DATE - $1, CURRENT_DATE, INTERVAL '1 day') AS d(date)
+        LEFT JOIN daily_revenue dr ON dr.date = d.date::date
+        ORDER BY d.date ASC
+    """,
+    "ps_profile_stats": """
+        PREPARE ps_profile_stats AS
+        SELECT v.profile_name,
+            COUNT(ft.id) AS total_sold,
+            COALESCE(SUM(ft.amount), 0) AS total_revenue,
+            COUNT(CASE WHEN v.is_used = TRUE THEN 1 END) AS used_count
+        FROM vouchers v
+        LEFT JOIN financial_transactions ft
+            ON v.voucher_code = ft.voucher_code AND ft.transaction_type='SALE'
+        GROUP BY v.profile_name
+        ORDER BY total_sold DESC
+    """,
+    # Explicit columns: a SELECT * plan would break once init_db adds a column
+    "ps_user_info": """
+        PREPARE ps_user_info(text) AS
+        SELECT username, profile_name, activated_at, is_active, last_seen,
+            uptime_limit, comment, password_type, is_voucher
+        FROM all_users WHERE username = $1
+    """,
+}
+
+
+class PreparedConnection(psycopg2.extensions.connection):
+    """Connection that remembers whether PREPARED_STATEMENTS ran on it"""
+    prepared = False
+    last_used = 0.0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # A fresh connection needs no ping before its first borrow
+        self.last_used = time.time()
+
+
+class IdleThreadedConnectionPool(ThreadedConnectionPool):
+    """ThreadedConnectionPool that keeps up to maxconn idle connections"""
+
+    def _putconn(self, conn, key=None, close=False):
+        # The base class closes anything returned above minconn, which made
+        # every borrow past the fifth reconnect and re-PREPARE. putconn()
+        # holds the pool lock, so swapping the threshold is safe.
+        minconn, self.minconn = self.minconn, self.maxconn
+        try:
+            super()._putconn(conn, key, close)
+        finally:
+            self.minconn = minconn
+
 
 class DatabaseService:
     def __init__(self, config: Config):
         self.config = config
         self.db_lock = threading.Lock()
-        self._connection_pool = []
-        self._max_pool_size = 5
+        self._pool: Optional[ThreadedConnectionPool] = None
+        self._min_pool_size = 5
+        self._max_pool_size = 30
         self._pool_lock = threading.Lock()
+        # Callers wait for a free connection instead of getting PoolError
+        self._pool_slots = threading.BoundedSemaphore(self._max_pool_size)
+        # Connections idle longer than this are pinged before reuse
+        self._test_on_borrow_interval = 30
+
+    def _initialize_pool(self) -> ThreadedConnectionPool:
+        """Create the shared connection pool on first use"""
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = IdleThreadedConnectionPool(
+                    self._min_pool_size,
+                    self._max_pool_size,
+                    connection_factory=PreparedConnection,
+                    **self.config.DB_CONFIG,
+                )
+            return self._pool
 
     @contextmanager
     def get_connection(self):
         """Get database connection from pool with context manager"""
-        conn = None
-        with self._pool_lock:
-            if self._connection_pool:
-                conn = self._connection_pool.pop()
-            else:
-                conn = self._create_connection()
+        pool = self._pool or self._initialize_pool()
+
+        self._pool_slots.acquire()
+        try:
+            conn = pool.getconn()
+            if time.time() - getattr(conn, "last_used", 0.0) > self._test_on_borrow_interval:
+                conn = self._validate_idle_connection(pool, conn)
+        except Exception:
+            self._pool_slots.release()
+            raise
 
         try:
+            if not conn.prepared:
+                self._prepare_statements(conn)
             yield conn
         except Exception:
-            if conn:
+            if not conn.closed:
                 conn.rollback()
             raise
         finally:
-            if conn:
-                # Return to pool if healthy, otherwise close
-                try:
-                    with self._pool_lock:
-                        if (
-                            len(self._connection_pool) < self._max_pool_size
-                            and conn.closed == 0
-                        ):
-                            self._connection_pool.append(conn)
-                        else:
-                            conn.close()
-                except Exception as e:
-                    logger.warning(f"Error returning connection to pool: {e}")
-                    conn.close()
+            # Broken connections are discarded; the pool reopens on demand
+            conn.last_used = time.time()
+            try:
+                pool.putconn(conn, close=bool(conn.closed))
+            except Exception as e:
+                logger.warning(f"Error returning connection to pool: {e}")
+            finally:
+                self._pool_slots.release()
 
-    def _create_connection(self):
-        """Create new database connection with optimized settings"""
-        conn = psycopg2.connect(**self.config.DB_CONFIG)
-        # Optimize connection settings
-        conn.autocommit = False
-        return conn
+    def _validate_idle_connection(self, pool, conn):
+        """Ping a connection that sat idle past the borrow interval; replace it if dead"""
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return conn
+        except psycopg2.Error:
+            pool.putconn(conn, close=True)
+            return pool.getconn()
+
+    def close(self):
+        """Close every pooled connection"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+
+    def _prepare_statements(self, conn):
+        """PREPARE the hot queries (retried on next use until the schema exists)"""
+        try:
+            with conn.cursor() as cursor:
+                for statement in PREPARED_STATEMENTS.values():
+                    cursor.execute(statement)
+            conn.commit()
+            conn.prepared = True
+        except psycopg2.Error as e:
+            # PREPARE survives ROLLBACK, so statements that succeeded before
+            # the failure would make every retry fail with "already exists";
+            # DEALLOCATE (once the aborted transaction is gone) starts clean
+            conn.rollback()
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("DEALLOCATE ALL")
+                conn.commit()
+            except psycopg2.Error:
+                conn.rollback()
+            logger.debug(f"Deferring prepared statements: {e}")
 
     def execute_query(
         self,
@@ -135,6 +260,13 @@ class DatabaseService:
             )
             """,
             """
+            CREATE TABLE IF NOT EXISTS daily_revenue (
+                date DATE PRIMARY KEY,
+                revenue NUMERIC NOT NULL DEFAULT 0,
+                voucher_count INTEGER NOT NULL DEFAULT 0
+            )
+            """,
+            """
             CREATE TABLE IF NOT EXISTS bandwidth_profiles (
                 id SERIAL PRIMARY KEY,
                 name TEXT UNIQUE NOT NULL,
@@ -245,7 +377,9 @@ class DatabaseService:
             "CREATE INDEX IF NOT EXISTS idx_users_last_seen ON all_users(last_seen)",
             "CREATE INDEX IF NOT EXISTS idx_users_activated ON all_users(activated_at)",
             "CREATE INDEX IF NOT EXISTS idx_profiles_name ON bandwidth_profiles(name)",
-            "CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)",
+            # Matches the LOWER(email)=LOWER(%s) login lookup; plain email is covered by its UNIQUE constraint
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email_lower ON users(LOWER(email))",
+            "DROP INDEX IF EXISTS idx_users_email",
             "CREATE INDEX IF NOT EXISTS idx_users_user_id ON users(user_id)",
             "CREATE INDEX IF NOT EXISTS idx_user_routers_user_id ON user_routers(user_id)",
             "CREATE INDEX IF NOT EXISTS idx_user_sessions_token ON user_sessions(token)",
@@ -261,6 +395,76 @@ class DatabaseService:
             except Exception as e:
                 logger.warning(f"Could not create index: {e}")
 
+        # Keep daily_revenue in step with SALE rows. The trigger and the
+        # one-time backfill share a transaction so no sale lands in between.
+        # voucher_count is distinct vouchers per day, so a sale only moves it
+        # when no other SALE for the same voucher exists on that day.
+        self.execute_query(
+            """
+            CREATE OR REPLACE FUNCTION rollup_daily_revenue() RETURNS trigger AS $$
+            DECLARE
+                counted INTEGER;
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.transaction_type = 'SALE'
+                        AND OLD.transaction_date IS NOT NULL THEN
+                    counted := CASE WHEN OLD.voucher_code IS NOT NULL AND NOT EXISTS (
+                        SELECT 1 FROM financial_transactions
+                        WHERE voucher_code = OLD.voucher_code
+                            AND transaction_type = 'SALE'
+                            AND transaction_date::date = OLD.transaction_date::date
+                            AND id <> OLD.id
+                    ) THEN 1 ELSE 0 END;
+                    UPDATE daily_revenue
+                    SET revenue = revenue - COALESCE(OLD.amount, 0),
+                        voucher_count = voucher_count - counted
+                    WHERE date = OLD.transaction_date::date;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.transaction_type = 'SALE'
+                        AND NEW.transaction_date IS NOT NULL THEN
+                    counted := CASE WHEN NEW.voucher_code IS NOT NULL AND NOT EXISTS (
+                        SELECT 1 FROM financial_transactions
+                        WHERE voucher_code = NEW.voucher_code
+                            AND transaction_type = 'SALE'
+                            AND transaction_date::date = NEW.transaction_date::date
+                            AND id <> NEW.id
+                    ) THEN 1 ELSE 0 END;
+                    INSERT INTO daily_revenue (date, revenue, voucher_count)
+                    VALUES (NEW.transaction_date::date, COALESCE(NEW.amount, 0), counted)
+                    ON CONFLICT (date) DO UPDATE SET
+                        revenue = daily_revenue.revenue + EXCLUDED.revenue,
+                        voucher_count = daily_revenue.voucher_count + EXCLUDED.voucher_count;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            -- CREATE TRIGGER takes an exclusive lock on the table; only do it once
+            DO $$
+            BEGIN
+                IF NOT EXISTS (
+                    SELECT 1 FROM pg_trigger
+                    WHERE tgname = 'trg_rollup_daily_revenue'
+                        AND tgrelid = 'financial_transactions'::regclass
+                ) THEN
+                    CREATE TRIGGER trg_rollup_daily_revenue
+                        AFTER INSERT OR UPDATE OR DELETE ON financial_transactions
+                        FOR EACH ROW EXECUTE PROCEDURE rollup_daily_revenue();
+                END IF;
+            EXCEPTION WHEN duplicate_object THEN
+                NULL;  -- another worker created it first
+            END;
+            $$;
+
+            INSERT INTO daily_revenue (date, revenue, voucher_count)
+            SELECT transaction_date::date, COALESCE(SUM(amount), 0), COUNT(DISTINCT voucher_code)
+            FROM financial_transactions
+            WHERE transaction_type = 'SALE'
+                AND transaction_date IS NOT NULL
+                AND NOT EXISTS (SELECT 1 FROM daily_revenue)
+            GROUP BY transaction_date::date;
+            """
+        )
+
         default_rates = [("day", 1000), ("week", 6000), ("month", 25000)]
         self.execute_query(
             """
@@ -277,30 +481,26 @@ class DatabaseService:
     def __init__(self, config: Config):
         self.config = config
         self.db_lock = threading.Lock()
-        self._connection_pool = []
-        self._max_pool_size = 5
+        self._pool: Optional[ThreadedConnectionPool] = None
+        self._min_pool_size = 5
+        self._max_pool_size = 30
         self._pool_lock = threading.Lock()
-        self._profile_cache = {}
+        # Callers wait for a free connection instead of getting PoolError
+        self._pool_slots = threading.BoundedSemaphore(self._max_pool_size)
+        # Connections idle longer than this are pinged before reuse
+        self._test_on_borrow_interval = 30
+        # Profiles and pricing rates change rarely; each entry expires on
+        # its own instead of the whole cache being dropped every 5 minutes
+        self._profile_cache = TTLCache(maxsize=256, ttl=300)
         self._cache_lock = threading.Lock()
-        self._cache_ttl = 300  # 5 minutes cache TTL
-        self._last_cache_cleanup = time.time()
-
-    def _clean_cache_if_needed(self):
-        """Clean cache periodically"""
-        current_time = time.time()
-        if current_time - self._last_cache_cleanup > self._cache_ttl:
-            with self._cache_lock:
-                self._profile_cache.clear()
-                self._last_cache_cleanup = current_time
 
     def get_profile(self, profile_name: str) -> Optional[Dict[str, Any]]:
         """Get profile with caching"""
-        self._clean_cache_if_needed()
-
         cache_key = f"profile_{profile_name.lower()}"
         with self._cache_lock:
-            if cache_key in self._profile_cache:
-                return self._profile_cache[cache_key]
+            cached = self._profile_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
         result = self.execute_query(
             "SELECT * FROM bandwidth_profiles WHERE LOWER(name)=LOWER(%s)",
@@ -314,6 +514,30 @@ class DatabaseService:
 
         return result
 
+    def get_profiles_by_names(self, names: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get several profiles in one query, keyed by the requested name"""
+        lowered = {name: name.lower() for name in names if name}
+        if not lowered:
+            return {}
+
+        rows = (
+            self.execute_query(
+                "SELECT * FROM bandwidth_profiles WHERE LOWER(name) = ANY(%s)",
+                (list(set(lowered.values())),),
+                fetch=True,
+            )
+            or []
+        )
+        by_lower = {row["name"].lower(): row for row in rows}
+
+        with self._cache_lock:
+            for key, row in by_lower.items():
+                self._profile_cache[f"profile_{key}"] = row
+
+        return {
+            name: by_lower[key] for name, key in lowered.items() if key in by_lower
+        }
+
     def get_all_profiles(self) -> List[Dict[str, Any]]:
         """Get all profiles with single query"""
         return (
@@ -353,9 +577,7 @@ class DatabaseService:
             )
             # Invalidate cache
             with self._cache_lock:
-                cache_key = f"profile_{profile.name.lower()}"
-                if cache_key in self._profile_cache:
-                    del self._profile_cache[cache_key]
+                self._profile_cache.pop(f"profile_{profile.name.lower()}", None)
             return True
         except Exception as e:
             logger.error(f"Error adding profile: {e}")
@@ -447,19 +669,27 @@ class DatabaseService:
             fetch_one=True,
         )
 
+    def get_vouchers(self, voucher_codes: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get several vouchers in one query, keyed by voucher code"""
+        if not voucher_codes:
+            return {}
+        rows = (
+            self.execute_query(
+                "SELECT * FROM vouchers WHERE voucher_code = ANY(%s)",
+                (list(voucher_codes),),
+                fetch=True,
+            )
+            or []
+        )
+        return {row["voucher_code"]: row for row in rows}
+
     # ---------------------------------------------------------
     # USER OPERATIONS (OPTIMIZED WITH BATCHING)
     # ---------------------------------------------------------
     def get_user_info(self, username: str) -> Optional[Dict[str, Any]]:
         """Get user information"""
         return self.execute_query(
-            """
-            SELECT username, profile_name, activated_at, is_active, last_seen,
-                   uptime_limit, comment, password_type, is_voucher
-            FROM all_users WHERE username=%s
-            """,
-            (username,),
-            fetch_one=True,
+            "EXECUTE ps_user_info(%s)", (username,), fetch_one=True
         )
 
     def get_all_users(self) -> List[Dict[str, Any]]:
@@ -477,6 +707,65 @@ class DatabaseService:
             or []
         )
 
+    def count_all_users(self) -> int:
+        result = self.execute_query(
+            "SELECT COUNT(*) AS total FROM all_users", fetch_one=True
+        )
+        return result["total"] if result else 0
+
+    def get_all_users_json(self, limit: int, offset: int) -> List[Dict[str, Any]]:
+        """
+        One page of users in get_all_users order, each already encoded as a
+        JSON object by PostgreSQL (dates in the same HTTP-date form as the
+        app's JSON encoder)
+        """
+        return (
+            self.execute_query(
+                """
+            SELECT username, json_build_object(
+                'username', username,
+                'profile_name', profile_name,
+                'is_active', COALESCE(is_active, FALSE),
+                'last_seen', to_char(last_seen, 'Dy, DD Mon YYYY HH24:MI:SS "GMT"'),
+                'uptime_limit', uptime_limit,
+                'comment', comment,
+                'password_type', password_type,
+                'is_voucher', COALESCE(is_voucher, FALSE)
+            )::text AS doc
+            FROM all_users
+            ORDER BY last_seen DESC NULLS LAST, username
+            LIMIT %s OFFSET %s
+            """,
+                (limit, offset),
+                fetch=True,
+            )
+            or []
+        )
+
+    def iter_users(self, after: int = 0, limit: int = 500):
+        """Yield one keyset page of users with id > after, in id order"""
+        rows = self.execute_query(
+            """
+            SELECT id, username, profile_name, is_active, last_seen,
+                   uptime_limit, comment, password_type, is_voucher
+            FROM all_users
+            WHERE id > %s
+            ORDER BY id
+            LIMIT %s
+            """,
+            (after, limit),
+            fetch=True,
+        )
+        yield from rows or ()
+
+    def approx_user_count(self) -> int:
+        """Planner estimate of all_users rows (kept current by autovacuum/ANALYZE)"""
+        result = self.execute_query(
+            "SELECT GREATEST(reltuples, 0)::bigint AS count FROM pg_class WHERE oid = 'all_users'::regclass",
+            fetch_one=True,
+        )
+        return result["count"] if result else 0
+
     def get_users_paginated(self, page: int = 1, page_size: int = 50) -> Dict[str, Any]:
         """Get users with pagination for better performance with large datasets"""
         offset = (page - 1) * page_size
@@ -513,11 +802,10 @@ class DatabaseService:
 
     def get_pricing_rates(self) -> Dict[str, int]:
         """Get pricing rates with caching"""
-        self._clean_cache_if_needed()
-
         with self._cache_lock:
-            if "pricing_rates" in self._profile_cache:
-                return self._profile_cache["pricing_rates"]
+            cached = self._profile_cache.get("pricing_rates")
+        if cached is not None:
+            return cached
 
         rows = (
             self.execute_query(
@@ -532,6 +820,27 @@ class DatabaseService:
 
         return rates
 
+    def update_pricing_rates(self, rates: Dict[str, int]) -> bool:
+        """Upsert pricing rates and drop the cached copy"""
+        try:
+            self.execute_query(
+                """
+                INSERT INTO pricing_rates (rate_type, amount)
+                VALUES (%s, %s)
+                ON CONFLICT (rate_type) DO UPDATE SET
+                    amount = EXCLUDED.amount,
+                    updated_at = CURRENT_TIMESTAMP
+                """,
+                batch_data=list(rates.items()),
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error updating pricing rates: {e}")
+            return False
+        finally:
+            with self._cache_lock:
+                self._profile_cache.pop("pricing_rates", None)
+
     def add_transaction(self, transaction: FinancialTransaction):
         """Add single transaction"""
         self.execute_query(
@@ -624,24 +933,26 @@ class DatabaseService:
         if not active_users:
             return
 
-        # Prepare batch data for upsert
-        upsert_data = []
+        # Prepare batch data for upsert, one row per username: a single
+        # INSERT ... ON CONFLICT cannot touch the same row twice
+        upsert_data = {}
         activation_data = []
 
         # Get profile uptimes in batch
         profile_names = list(
-            set(u.get("profile_name", "default") for u in active_users)
+            set(u.get("profile_name") or u.get("profile") or "default" for u in active_users)
         )
-        profile_uptimes = {}
-        for profile_name in profile_names:
-            profile_uptimes[profile_name] = self._get_profile_uptime(profile_name)
+        profile_uptimes = {
+            name: profile["uptime_limit"]
+            for name, profile in self.get_profiles_by_names(profile_names).items()
+        }
 
         for u in active_users:
             username = u.get("username") or u.get("user") or u.get("name")
             if not username:
                 continue
 
-            profile_name = u.get("profile_name", "default")
+            profile_name = u.get("profile_name") or u.get("profile") or "default"
             uptime_str = u.get("uptime", "0")
             try:
                 uptime_seconds = int(uptime_str)
@@ -650,25 +961,37 @@ class DatabaseService:
 
             uptime_limit = profile_uptimes.get(profile_name, "1d")
 
-            upsert_data.append((username, profile_name, True, uptime_limit))
+            upsert_data[username] = (username, profile_name, True, uptime_limit)
 
             if uptime_seconds > 1:
                 activation_data.append((username, uptime_seconds))
 
-        # Batch upsert users
+        # Upsert all users in one statement and transaction
         if upsert_data:
-            self.execute_query(
-                """
-                INSERT INTO all_users (username, profile_name, is_active, uptime_limit, last_seen)
-                VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
-                ON CONFLICT (username) DO UPDATE SET
-                    profile_name = EXCLUDED.profile_name,
-                    is_active = EXCLUDED.is_active,
-                    uptime_limit = EXCLUDED.uptime_limit,
-                    last_seen = CURRENT_TIMESTAMP
-                """,
-                batch_data=upsert_data,
-            )
+            rows = list(upsert_data.values())
+            with self.get_connection() as conn:
+                try:
+                    with conn.cursor() as cursor:
+                        execute_values(
+                            cursor,
+                            """
+                            INSERT INTO all_users (username, profile_name, is_active, uptime_limit, last_seen)
+                            VALUES %s
+                            ON CONFLICT (username) DO UPDATE SET
+                                profile_name = EXCLUDED.profile_name,
+                                is_active = EXCLUDED.is_active,
+                                uptime_limit = EXCLUDED.uptime_limit,
+                                last_seen = EXCLUDED.last_seen
+                            """,
+                            rows,
+                            template="(%s, %s, %s, %s, CURRENT_TIMESTAMP)",
+                            page_size=len(rows),
+                        )
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    logger.error(f"Error upserting active users: {e}")
+                    raise
 
         # Process activations
         for username, uptime_seconds in activation_data:
@@ -689,15 +1012,7 @@ class DatabaseService:
     # ---------------------------------------------------------
     def calculate_daily_revenue(self) -> int:
         """Calculate daily revenue with optimized query"""
-        result = self.execute_query(
-            """
-            SELECT COALESCE(SUM(amount), 0) AS total
-            FROM financial_transactions
-            WHERE transaction_type = 'SALE'
-            AND DATE(transaction_date) = CURRENT_DATE
-            """,
-            fetch_one=True,
-        )
+        result = self.execute_query("EXECUTE ps_daily_revenue", fetch_one=True)
         return result["total"] if result else 0
 
     def get_financial_stats(
@@ -706,16 +1021,7 @@ class DatabaseService:
         """Return summarized stats of vouchers and sales with single query execution"""
 
         # Use single query to get multiple stats
-        stats_query = """
-        SELECT 
-            (SELECT COALESCE(SUM(amount),0) FROM financial_transactions WHERE transaction_type='SALE') as total_revenue,
-            (SELECT COALESCE(SUM(amount),0) FROM financial_transactions WHERE transaction_type='SALE' AND DATE(transaction_date)=CURRENT_DATE) as daily_revenue,
-            (SELECT COUNT(*) FROM vouchers WHERE is_used=FALSE) as active_vouchers,
-            (SELECT COUNT(*) FROM vouchers WHERE is_used=TRUE AND DATE(activated_at)=CURRENT_DATE) as used_today,
-            (SELECT COUNT(*) FROM all_users WHERE DATE(activated_at)=CURRENT_DATE) as daily_activations
-        """
-
-        result = self.execute_query(stats_query, fetch_one=True) or {}
+        result = self.execute_query("EXECUTE ps_financial_stats", fetch_one=True) or {}
 
         return {
             "total_revenue": result.get("total_revenue", 0),
@@ -725,6 +1031,19 @@ class DatabaseService:
             "daily_activations": result.get("daily_activations", 0),
         }
 
+    def get_revenue_series(self, days: int) -> List[Dict[str, Any]]:
+        """Daily revenue and voucher count for the last N days, oldest first"""
+        return (
+            self.execute_query(
+                "EXECUTE ps_revenue_series(%s)", (max(days, 1) - 1,), fetch=True
+            )
+            or []
+        )
+
+    def get_profile_stats(self) -> List[Dict[str, Any]]:
+        """Per-profile sales and revenue summary"""
+        return self.execute_query("EXECUTE ps_profile_stats", fetch=True) or []
+
     def get_daily_activations(self) -> int:
         """Get daily activations count"""
         result = self.execute_query(
@@ -804,7 +1123,8 @@ class DatabaseService:
         return {
             "table_statistics": table_stats,
             "index_statistics": index_stats,
-            "connection_pool_size": len(self._connection_pool),
+            "connection_pool_size": len(getattr(self._pool, "_pool", [])),
+            "connection_pool_max": self._max_pool_size,
         }
 
     def register_user(self, user_data: dict) -> bool:
@@ -853,6 +1173,8 @@ class DatabaseService:
                 "full_name": user["full_name"],
                 "role": user["role"],
                 "company_name": user["company_name"],
+                "is_active": user["is_active"],
+                "is_verified": user["is_verified"],
                 "password": user["password"],  # For verification in auth service
             }
         return None
@@ -1025,7 +1347,7 @@ class DatabaseService:
         """Validate password reset token"""
         return self.execute_query(
             """
-            SELECT pr.*, u.user_id, u.email
+            SELECT pr.id, pr.token, pr.expires_at, pr.used, u.user_id, u.email
             FROM password_resets pr
             JOIN users u ON pr.user_id = u.id
             WHERE pr.token = %s AND pr.used = FALSE AND pr.expires_at > CURRENT_TIMESTAMP
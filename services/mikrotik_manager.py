@@ -1,10 +1,55 @@
 import routeros_api
 import logging
-from typing import List, Dict, Any, Optional, Tuple
+import threading
+import time
+from typing import Callable, List, Dict, Any, Optional, Tuple, TypeVar
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Idle RouterOS sessions are closed after this many seconds
+POOL_IDLE_TTL = 300
+# Idle sessions kept per (host, username); extras are closed on release
+POOL_MAX_IDLE = 4
+# How often the background sweeper closes sessions past POOL_IDLE_TTL
+POOL_SWEEP_INTERVAL = 60
+
+# Errors that mean the session itself is gone rather than the router
+# rejecting the command; a reused session failing with one is retried
+_SESSION_ERRORS = (
+    routeros_api.exceptions.RouterOsApiConnectionError,
+    routeros_api.exceptions.RouterOsApiFatalCommunicationError,
+    OSError,
+)
+
+
+class PooledConnection:
+    """Checked-out RouterOS session; disconnect() hands it back to the pool"""
+
+    def __init__(
+        self,
+        manager: "MikroTikManager",
+        key: Tuple[str, str, str],
+        connection,
+        api,
+        reused: bool = False,
+    ):
+        self._manager = manager
+        self._key = key
+        self.connection = connection
+        self.api = api
+        self.reused = reused
+        self.broken = False
+
+    def discard(self):
+        """Mark the session unusable so it is closed instead of reused"""
+        self.broken = True
+
+    def disconnect(self):
+        self._manager._release(self)
+
 
 class MikroTikManager:
     def __init__(self, config: Config):
@@ -12,35 +57,166 @@ class MikroTikManager:
         self.username = config.MIKROTIK_CONFIG["username"]
         self.password = config.MIKROTIK_CONFIG["password"]
 
-    def get_api(self) -> Tuple[Optional[routeros_api.RouterOsApiPool], Optional[Any]]:
-        """Return a fresh MikroTik API connection"""
+        # (host, username, password) -> [(RouterOsApiPool, api, last_used)]
+        self._pool: Dict[Tuple[str, str, str], List[Tuple[Any, Any, float]]] = {}
+        self._pool_lock = threading.Lock()
+        self._sweep_stop = threading.Event()
+        self._sweep_thread: Optional[threading.Thread] = None
+
+    def get_conn(
+        self, host: str, username: str, password: str, fresh: bool = False
+    ) -> PooledConnection:
+        """Check out a logged-in session, reusing an idle one unless fresh"""
+        key = (host, username, password)
+        now = time.monotonic()
+        expired = []
+        entry = None
+
+        if not fresh:
+            with self._pool_lock:
+                idle = self._pool.get(key, [])
+                while idle:
+                    connection, api, last_used = idle.pop()
+                    if now - last_used > POOL_IDLE_TTL:
+                        expired.append(connection)
+                    else:
+                        entry = (connection, api)
+                        break
+
+        for connection in expired:
+            self._close(connection)
+
+        if entry is not None:
+            return PooledConnection(self, key, *entry, reused=True)
+
+        connection = routeros_api.RouterOsApiPool(
+            host,
+            username=username,
+            password=password,
+            plaintext_login=True,
+        )
         try:
-            connection = routeros_api.RouterOsApiPool(
-                self.host,
-                username=self.username,
-                password=self.password,
-                plaintext_login=True,
-            )
             api = connection.get_api()
-            return connection, api
+        except Exception:
+            self._close(connection)
+            raise
+        return PooledConnection(self, key, connection, api)
+
+    def _release(self, lease: PooledConnection):
+        if lease.broken:
+            self._close(lease.connection)
+            return
+        with self._pool_lock:
+            idle = self._pool.setdefault(lease._key, [])
+            if len(idle) < POOL_MAX_IDLE:
+                idle.append((lease.connection, lease.api, time.monotonic()))
+                return
+        self._close(lease.connection)
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.disconnect()
         except Exception as e:
-            logger.error(f"MikroTik connection failed: {e}")
-            return None, None
+            logger.debug(f"Error closing MikroTik connection: {e}")
+
+    def _call(
+        self,
+        operation: Callable[[Any], T],
+        host: Optional[str] = None,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+    ) -> T:
+        """Run operation(api) on a pooled session, defaulting to the configured router
+
+        A reused session may have been dropped by the router while it sat
+        idle; if the call fails with a session error it is retried once on a
+        fresh login. Any other error discards the session and propagates.
+        """
+        key = (host or self.host, username or self.username, password or self.password)
+        lease = self.get_conn(*key)
+        try:
+            return operation(lease.api)
+        except _SESSION_ERRORS as e:
+            lease.discard()
+            if not lease.reused:
+                raise
+            logger.info(f"Reused MikroTik session failed ({e}); retrying on a fresh login")
+        except Exception:
+            lease.discard()
+            raise
+        finally:
+            lease.disconnect()
+
+        lease = self.get_conn(*key, fresh=True)
+        try:
+            return operation(lease.api)
+        except Exception:
+            lease.discard()
+            raise
+        finally:
+            lease.disconnect()
+
+    def sweep_idle(self):
+        """Close idle sessions past POOL_IDLE_TTL for every router"""
+        cutoff = time.monotonic() - POOL_IDLE_TTL
+        expired = []
+        with self._pool_lock:
+            for key, idle in list(self._pool.items()):
+                keep = [entry for entry in idle if entry[2] >= cutoff]
+                expired.extend(entry[0] for entry in idle if entry[2] < cutoff)
+                if keep:
+                    self._pool[key] = keep
+                else:
+                    del self._pool[key]
+        for connection in expired:
+            self._close(connection)
+
+    def _sweep_worker(self, interval: int):
+        while not self._sweep_stop.wait(interval):
+            try:
+                self.sweep_idle()
+            except Exception as e:
+                logger.error(f"MikroTik idle sweep failed: {e}")
+
+    def start_idle_sweeper(self, interval: int = POOL_SWEEP_INTERVAL):
+        """Start the thread that closes idle sessions (idempotent)"""
+        if self._sweep_thread and self._sweep_thread.is_alive():
+            return
+        self._sweep_stop.clear()
+        self._sweep_thread = threading.Thread(
+            target=self._sweep_worker, args=(interval,), daemon=True
+        )
+        self._sweep_thread.start()
+
+    def close(self):
+        """Stop the sweeper and close every idle pooled session"""
+        self._sweep_stop.set()
+        with self._pool_lock:
+            entries = [entry for idle in self._pool.values() for entry in idle]
+            self._pool.clear()
+        for connection, _, _ in entries:
+            self._close(connection)
+
+    def connect_router(self, host: str, username: str, password: str) -> bool:
+        """Verify credentials against a router, raising on failure"""
+        self._call(
+            lambda api: api.get_resource("/system/identity").get(),
+            host,
+            username,
+            password,
+        )
+        return True
 
     def get_profiles(self) -> List[Dict[str, Any]]:
         """Get all hotspot user profiles"""
-        connection, api = self.get_api()
-        if not api:
-            return []
         try:
-            profiles = api.get_resource("/ip/hotspot/user/profile")
-            return profiles.get()
+            return self._call(
+                lambda api: api.get_resource("/ip/hotspot/user/profile").get()
+            )
         except Exception as e:
             logger.error(f"Error fetching profiles: {e}")
             return []
-        finally:
-            if connection:
-                connection.disconnect()
 
     def create_voucher(
         self,
@@ -51,26 +227,23 @@ class MikroTikManager:
         uptime_limit: str = "1d",
     ) -> bool:
         """Create voucher user on MikroTik"""
-        connection, api = self.get_api()
-        if not api:
-            return False
-        try:
-            users = api.get_resource("/ip/hotspot/user")
+        # Determine password
+        final_password = ""
+        if password == "same":
+            final_password = code
+        elif password is not None:
+            final_password = password
 
-            # Determine password
-            final_password = ""
-            if password == "same":
-                final_password = code
-            elif password is not None:
-                final_password = password
-
-            users.add(
-                name=code,
-                password=final_password,
-                profile=profile_name,
-                comment=comment,
-                disabled="no",
-                limit_uptime=uptime_limit,
+        try:
+            self._call(
+                lambda api: api.get_resource("/ip/hotspot/user").add(
+                    name=code,
+                    password=final_password,
+                    profile=profile_name,
+                    comment=comment,
+                    disabled="no",
+                    limit_uptime=uptime_limit,
+                )
             )
             logger.info(
                 f"Voucher {code} created with profile {profile_name} and uptime {uptime_limit}"
@@ -79,155 +252,101 @@ class MikroTikManager:
         except Exception as e:
             logger.error(f"Error creating voucher: {e}")
             return False
-        finally:
-            if connection:
-                connection.disconnect()
 
     def get_all_users(self) -> List[Dict[str, Any]]:
         """Get all hotspot users from MikroTik"""
-        connection, api = self.get_api()
-        if not api:
-            return []
         try:
-            users = api.get_resource("/ip/hotspot/user")
-            return users.get()
+            return self._call(lambda api: api.get_resource("/ip/hotspot/user").get())
         except Exception as e:
             logger.error(f"Error fetching all users: {e}")
             return []
-        finally:
-            if connection:
-                connection.disconnect()
 
     def get_active_users(self) -> List[Dict[str, Any]]:
         """Get currently active hotspot users"""
-        connection, api = self.get_api()
-        if not api:
-            return []
         try:
-            active = api.get_resource("/ip/hotspot/active")
-            result = active.get()
-            formatted_result = []
-            for user in result:
-                formatted_result.append(
-                    {
-                        "user": user.get("user", ""),
-                        "profile": user.get("profile", ""),
-                        "uptime": user.get("uptime", ""),
-                        "bytes-in": user.get("bytes-in", "0"),
-                        "bytes-out": user.get("bytes-out", "0"),
-                        "server": user.get("server", ""),
-                    }
-                )
-            return formatted_result
+            result = self._call(lambda api: api.get_resource("/ip/hotspot/active").get())
         except Exception as e:
             logger.error(f"Error fetching active users: {e}")
             return []
-        finally:
-            if connection:
-                connection.disconnect()
+        return [
+            {
+                "user": user.get("user", ""),
+                "profile": user.get("profile", ""),
+                "uptime": user.get("uptime", ""),
+                "bytes-in": user.get("bytes-in", "0"),
+                "bytes-out": user.get("bytes-out", "0"),
+                "server": user.get("server", ""),
+            }
+            for user in result
+        ]
 
     def get_user_usage(self, username: str) -> Optional[Dict[str, Any]]:
         """Get usage statistics for a specific user"""
-        connection, api = self.get_api()
-        if not api:
-            return None
         try:
-            users = api.get_resource("/ip/hotspot/user")
-            stats = users.get(name=username)
-            if stats:
-                return {
-                    "bytes_in": int(stats[0].get("bytes-in", 0)),
-                    "bytes_out": int(stats[0].get("bytes-out", 0)),
-                    "uptime": stats[0].get("uptime", "0s"),
-                    "limit_uptime": stats[0].get("limit-uptime", ""),
-                    "disabled": stats[0].get("disabled", "no"),
-                    "comment": stats[0].get("comment", ""),
-                }
-            return None
+            stats = self._call(
+                lambda api: api.get_resource("/ip/hotspot/user").get(name=username)
+            )
+            return self._usage_from_user(stats[0]) if stats else None
         except Exception as e:
             logger.error(f"Error fetching user usage: {e}")
             return None
-        finally:
-            if connection:
-                connection.disconnect()
+
+    @staticmethod
+    def _usage_from_user(u: Dict[str, Any]) -> Dict[str, Any]:
+        """Usage fields from one /ip/hotspot/user row"""
+        return {
+            "bytes_in": int(u.get("bytes-in", 0)),
+            "bytes_out": int(u.get("bytes-out", 0)),
+            "uptime": u.get("uptime", "0s"),
+            "limit_uptime": u.get("limit-uptime", ""),
+            "disabled": u.get("disabled", "no"),
+            "comment": u.get("comment", ""),
+        }
 
     def get_all_users_usage(self) -> Dict[str, Dict[str, Any]]:
         """
         Fetch all hotspot users and their usage stats in a single API call.
         Returns a dictionary keyed by username.
         """
-        connection, api = self.get_api()
-        if not api:
-            return {}
         try:
-            users = api.get_resource("/ip/hotspot/user")
-            user_list = users.get()
-
-            usage_dict = {}
-            for u in user_list:
-                username = u.get("name")
-                usage_dict[username] = {
-                    "bytes_in": int(u.get("bytes-in", 0)),
-                    "bytes_out": int(u.get("bytes-out", 0)),
-                    "uptime": u.get("uptime", "0s"),
-                    "limit_uptime": u.get("limit-uptime", ""),
-                    "disabled": u.get("disabled", "no"),
-                    "comment": u.get("comment", ""),
-                }
-            return usage_dict
+            user_list = self._call(lambda api: api.get_resource("/ip/hotspot/user").get())
+            return {u.get("name"): self._usage_from_user(u) for u in user_list}
         except Exception as e:
             logger.error(f"Error fetching all users usage: {e}")
             return {}
-        finally:
-            if connection:
-                connection.disconnect()
 
     def get_bulk_user_usage(self, usernames: List[str]) -> Dict[str, Dict[str, Any]]:
         """
         Fetch usage only for specific usernames efficiently.
         Returns a dictionary keyed by username.
         """
-        connection, api = self.get_api()
-        if not api:
+        if not usernames:
             return {}
         try:
-            users = api.get_resource("/ip/hotspot/user")
-            user_list = users.get()
-
-            usage_dict = {}
-            for u in user_list:
-                name = u.get("name")
-                if name in usernames:
-                    usage_dict[name] = {
-                        "bytes_in": int(u.get("bytes-in", 0)),
-                        "bytes_out": int(u.get("bytes-out", 0)),
-                        "uptime": u.get("uptime", "0s"),
-                        "limit_uptime": u.get("limit-uptime", ""),
-                        "disabled": u.get("disabled", "no"),
-                        "comment": u.get("comment", ""),
-                    }
-            return usage_dict
+            user_list = self._call(lambda api: api.get_resource("/ip/hotspot/user").get())
+
+            wanted = set(usernames)
+            return {
+                u.get("name"): self._usage_from_user(u)
+                for u in user_list
+                if u.get("name") in wanted
+            }
         except Exception as e:
             logger.error(f"Error fetching bulk user usage: {e}")
             return {}
-        finally:
-            if connection:
-                connection.disconnect()
 
     def get_system_info(self) -> Dict[str, Any]:
         """Get MikroTik system information including exact model with better error handling"""
-        connection, api = self.get_api()
-        if not api:
-            return {}
 
-        try:
-            system_resource = api.get_resource("/system/resource")
-            identity_resource = api.get_resource("/system/identity")
-            routerboard_resource = api.get_resource("/system/routerboard")
+        def fetch(api):
+            return (
+                api.get_resource("/system/resource").get(),
+                api.get_resource("/system/identity").get(),
+                api.get_resource("/system/routerboard").get(),
+            )
 
-            system_info = system_resource.get()
-            identity_info = identity_resource.get()
-            routerboard_info = routerboard_resource.get()
+        try:
+            system_info, identity_info, routerboard_info = self._call(fetch)
 
             if system_info and identity_info:
                 model = "Unknown"
@@ -259,8 +378,9 @@ class MikroTikManager:
         except Exception as e:
             logger.error(f"Error fetching system info: {e}")
             try:
-                system_resource = api.get_resource("/system/resource")
-                system_info = system_resource.get()
+                system_info = self._call(
+                    lambda api: api.get_resource("/system/resource").get()
+                )
                 if system_info:
                     return {
                         "router_name": "Unknown",
@@ -276,46 +396,142 @@ class MikroTikManager:
             except Exception as fallback_error:
                 logger.error(f"Fallback system info also failed: {fallback_error}")
             return {}
-        finally:
-            if connection:
-                connection.disconnect()
 
     def remove_expired_user(self, username: str) -> bool:
         """Remove expired user from MikroTik"""
-        connection, api = self.get_api()
-        if not api:
-            return False
-        try:
+
+        def remove(api):
             users = api.get_resource("/ip/hotspot/user")
             user_list = users.get(name=username)
             if user_list:
                 users.remove(id=user_list[0]["id"])
-                logger.info(f"Removed expired user: {username}")
                 return True
             return False
+
+        try:
+            removed = self._call(remove)
         except Exception as e:
             logger.error(f"Error removing expired user {username}: {e}")
             return False
-        finally:
-            if connection:
-                connection.disconnect()
+        if removed:
+            logger.info(f"Removed expired user: {username}")
+        return removed
 
     def update_user_comment(self, username: str, comment: str) -> bool:
         """Update user comment in MikroTik"""
-        connection, api = self.get_api()
-        if not api:
-            return False
-        try:
+        return username in self.update_user_comments([(username, comment)])
+
+    def update_user_comments(self, updates: List[Tuple[str, str]]) -> List[str]:
+        """Update several (username, comment) pairs over one router connection
+
+        The API is tagged, so every lookup sentence is written before any
+        reply is read, then every set sentence likewise: two round trips for
+        the whole batch. Returns the usernames updated; unknown users and
+        per-user router errors are skipped.
+        """
+        if not updates:
+            return []
+
+        updated = []
+
+        def apply(api):
+            # Setting a comment is idempotent, so a retry may redo the batch
+            updated.clear()
             users = api.get_resource("/ip/hotspot/user")
-            user_list = users.get(name=username)
-            if user_list:
-                users.set(id=user_list[0]["id"], comment=comment)
-                logger.info(f"Updated comment for user: {username}")
-                return True
-            return False
+            lookups = [
+                (username, comment, users.get_async(name=username))
+                for username, comment in updates
+            ]
+
+            # set_async in routeros_api waits for its reply, so use call_async
+            pending_sets = []
+            for username, comment, lookup in lookups:
+                user_list = lookup.get()
+                if user_list:
+                    pending_sets.append(
+                        (
+                            username,
+                            users.call_async(
+                                "set", {"id": user_list[0]["id"], "comment": comment}
+                            ),
+                        )
+                    )
+
+            for username, pending in pending_sets:
+                try:
+                    pending.get()
+                    updated.append(username)
+                except routeros_api.exceptions.RouterOsApiCommunicationError as e:
+                    logger.error(f"Error updating comment for {username}: {e}")
+
+        try:
+            self._call(apply)
+            logger.info(f"Updated comments for {len(updated)} users")
         except Exception as e:
-            logger.error(f"Error updating user comment {username}: {e}")
-            return False
-        finally:
-            if connection:
-                connection.disconnect()
+            logger.error(f"Error updating user comments: {e}")
+        return updated
+
+
+class MikroTikSnapshot:
+    """
+    Profiles and system info polled from the router in the background, so
+    frontend polling no longer turns into RouterOS queries one-for-one.
+    """
+
+    def __init__(self, mikrotik_manager: MikroTikManager, interval: int = 15):
+        self.mikrotik = mikrotik_manager
+        self.interval = interval
+        self._profiles: List[Dict[str, Any]] = []
+        self._system_info: Dict[str, Any] = {}
+        self._loaded = False
+        self._lock = threading.RLock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self):
+        """Fetch both views now; a failed fetch keeps the previous value"""
+        profiles = self.mikrotik.get_profiles()
+        system_info = self.mikrotik.get_system_info()
+        with self._lock:
+            if profiles or not self._loaded:
+                self._profiles = profiles
+            if system_info or not self._loaded:
+                self._system_info = system_info
+            self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.refresh()
+
+    def get_profiles(self) -> List[Dict[str, Any]]:
+        """Copies of the polled profiles, safe for callers to modify"""
+        self._ensure_loaded()
+        with self._lock:
+            return [dict(profile) for profile in self._profiles]
+
+    def get_system_info(self) -> Dict[str, Any]:
+        self._ensure_loaded()
+        with self._lock:
+            return dict(self._system_info)
+
+    def _poll(self):
+        while not self._stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing MikroTik snapshot: {e}")
+            self._stop_event.wait(self.interval)
+
+    def start(self):
+        """Start the poller thread (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._poll, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
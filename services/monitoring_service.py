@@ -268,11 +268,13 @@ class MonitoringService:
             if to_mark_inactive:
                 self.db.update_user_active_status(to_mark_inactive, False)
 
+            # One router listing for every active user's counters
+            usages = self.mikrotik.get_bulk_user_usage(list(active_usernames))
             for username in active_usernames:
                 voucher = self.db.get_voucher(username)
                 if voucher and not voucher.get("is_used"):
                     self._handle_voucher_activation(username, active_map.get(username))
-                self._maybe_update_usage(username)
+                self._maybe_update_usage(username, usages.get(username, {}))
 
         except Exception:
             logger.exception("monitor_active_users failed")
@@ -314,14 +316,17 @@ class MonitoringService:
         except Exception:
             logger.exception("_handle_voucher_activation failed for %s", username)
 
-    def _maybe_update_usage(self, username: str):
+    def _maybe_update_usage(
+        self, username: str, usage: Optional[Dict[str, Any]] = None
+    ):
         """Update voucher usage only when threshold exceeded or max_age exceeded."""
         try:
             voucher = self.db.get_voucher(username)
             if not voucher:
                 return
 
-            usage = self.mikrotik.get_user_usage(username) or {}
+            if usage is None:
+                usage = self.mikrotik.get_user_usage(username) or {}
             bytes_in = int(usage.get("bytes_in", 0) or 0)
             bytes_out = int(usage.get("bytes_out", 0) or 0)
             total = bytes_in + bytes_out
@@ -378,11 +383,13 @@ class MonitoringService:
                 if (e.get("user") or e.get("name") or e.get("username"))
             }
 
+            usages = self.mikrotik.get_bulk_user_usage([r["username"] for r in rows])
+
             for r in rows:
                 username = r["username"]
                 uptime_limit = r.get("uptime_limit") or "0s"
 
-                usage = self.mikrotik.get_user_usage(username) or {}
+                usage = usages.get(username, {})
                 current_uptime = usage.get("uptime", "0s")
 
                 try:
@@ -1,10 +1,18 @@
 import random
 import string
 import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 from pathlib import Path
 
+from cachetools import TTLCache
+
 from config import Config
 from models.schemas import Voucher
 from utils.helpers import generate_voucher_code, calculate_expiry_time
@@ -42,6 +50,23 @@ except ImportError:
         "PDF generation libraries not available. Install reportlab for PDF support."
     )
 
+try:
+    from eventlet import tpool
+    from eventlet.patcher import is_monkey_patched
+
+    # reportlab rendering would otherwise hold the eventlet hub for the
+    # whole PDF, so every render runs on a native thread
+    PDF_OFFLOAD = is_monkey_patched("thread")
+except ImportError:
+    PDF_OFFLOAD = False
+
+# Finished jobs stay pollable for an hour
+PDF_JOB_TTL = 3600
+
+# Generated PDFs older than this are removed by the periodic cleanup
+PDF_RETENTION_DAYS = 7
+PDF_CLEANUP_INTERVAL = 6 * 3600
+
 
 class VoucherService:
     def __init__(self, config: Config, database_service, mikrotik_manager):
@@ -54,6 +79,117 @@ class VoucherService:
             else Path("pdf_vouchers")
         )
         self.pdf_output_dir.mkdir(exist_ok=True)
+        self._pdf_jobs = TTLCache(maxsize=1000, ttl=PDF_JOB_TTL)
+        self._pdf_jobs_lock = threading.Lock()
+        self._pdf_executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="pdf-job"
+        )
+        self._cleanup_stop = threading.Event()
+        self._cleanup_thread: Optional[threading.Thread] = None
+
+    # ---------------------------------------------------------
+    # BACKGROUND PDF JOBS
+    # ---------------------------------------------------------
+    def submit_pdf_job(self, render, *args) -> str:
+        """Queue render(*args) on the PDF workers and return the job id"""
+        job_id = uuid.uuid4().hex
+        with self._pdf_jobs_lock:
+            self._pdf_jobs[job_id] = {
+                "job_id": job_id,
+                "status": "queued",
+                "pdf_path": None,
+                "error": None,
+            }
+        self._pdf_executor.submit(self._run_pdf_job, job_id, render, args)
+        return job_id
+
+    def get_pdf_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Snapshot of a PDF job, or None if unknown or expired"""
+        with self._pdf_jobs_lock:
+            job = self._pdf_jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _update_pdf_job(self, job_id: str, **fields):
+        with self._pdf_jobs_lock:
+            job = self._pdf_jobs.get(job_id)
+            if job:
+                job.update(fields)
+
+    @staticmethod
+    def render_pdf(render, *args) -> Optional[str]:
+        """Call render(*args) off the eventlet hub when running under eventlet"""
+        if PDF_OFFLOAD:
+            return tpool.execute(render, *args)
+        return render(*args)
+
+    def _run_pdf_job(self, job_id: str, render, args):
+        self._update_pdf_job(job_id, status="running")
+        try:
+            pdf_path = self.render_pdf(render, *args)
+        except Exception as e:
+            logger.error(f"PDF job {job_id} failed: {e}")
+            self._update_pdf_job(job_id, status="failed", error=str(e))
+            return
+
+        if pdf_path:
+            self._update_pdf_job(job_id, status="done", pdf_path=pdf_path)
+        else:
+            self._update_pdf_job(
+                job_id, status="failed", error="PDF generation failed"
+            )
+
+    # ---------------------------------------------------------
+    # PDF CLEANUP
+    # ---------------------------------------------------------
+    def cleanup_pdfs(self, older_than_days: float = PDF_RETENTION_DAYS) -> List[str]:
+        """Delete generated PDFs older than the cutoff and return their names"""
+        cutoff_time = time.time() - older_than_days * 24 * 60 * 60
+        deleted_files = []
+        try:
+            with os.scandir(self.pdf_output_dir) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(".pdf"):
+                        continue
+                    try:
+                        if entry.stat().st_ctime < cutoff_time:
+                            os.unlink(entry.path)
+                            deleted_files.append(entry.name)
+                    except FileNotFoundError:
+                        continue  # removed concurrently
+        except FileNotFoundError:
+            return deleted_files
+
+        if deleted_files:
+            logger.info(f"Cleaned up {len(deleted_files)} PDF files")
+        return deleted_files
+
+    def submit_pdf_cleanup(self, older_than_days: float = PDF_RETENTION_DAYS):
+        """Run cleanup_pdfs on the PDF workers instead of the caller's thread"""
+        self._pdf_executor.submit(self.cleanup_pdfs, older_than_days)
+
+    def _cleanup_worker(self, interval: int, older_than_days: float):
+        while not self._cleanup_stop.wait(interval):
+            try:
+                self.cleanup_pdfs(older_than_days)
+            except Exception as e:
+                logger.error(f"PDF cleanup failed: {e}")
+
+    def start_pdf_cleanup(
+        self,
+        interval: int = PDF_CLEANUP_INTERVAL,
+        older_than_days: float = PDF_RETENTION_DAYS,
+    ):
+        """Start the periodic PDF cleanup thread (idempotent)"""
+        if self._cleanup_thread and self._cleanup_thread.is_alive():
+            return
+        self._cleanup_stop.clear()
+        self._cleanup_thread = threading.Thread(
+            target=self._cleanup_worker, args=(interval, older_than_days), daemon=True
+        )
+        self._cleanup_thread.start()
+
+    def stop_pdf_cleanup(self):
+        self._cleanup_stop.set()
 
     def generate_voucher_code(self, uptime_limit: str) -> str:
         """Generate unique voucher code based on uptime limit"""
@@ -155,7 +291,9 @@ class VoucherService:
                     successful_creations += 1
 
                     if generate_pdf and PDF_AVAILABLE:
-                        pdf_path = self.generate_single_voucher_pdf(voucher_data)
+                        pdf_path = self.render_pdf(
+                            self.generate_single_voucher_pdf, voucher_data
+                        )
                         if pdf_path:
                             pdf_paths.append(pdf_path)
                             voucher_data["pdf_path"] = pdf_path
@@ -167,8 +305,8 @@ class VoucherService:
                 logger.error(f"Error creating voucher {i+1}: {e}")
                 continue
         if generate_pdf and PDF_AVAILABLE and len(vouchers) > 1:
-            batch_pdf_path = self.generate_batch_vouchers_pdf(
-                vouchers, profile_name, customer_name
+            batch_pdf_path = self.render_pdf(
+                self.generate_batch_vouchers_pdf, vouchers, profile_name, customer_name
             )
             if batch_pdf_path:
                 for voucher in vouchers:
@@ -687,6 +825,22 @@ class VoucherService:
             logger.error(f"Error generating voucher card PDF: {e}")
             return None
 
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def calculate_price(profile_name: str) -> int:
+        """Default price for a profile with no pricing row, from its name"""
+        if not profile_name:
+            return 0
+
+        profile_name_lower = profile_name.lower()
+        if "1day" in profile_name_lower or "daily" in profile_name_lower:
+            return 1000
+        elif "1week" in profile_name_lower or "weekly" in profile_name_lower:
+            return 6000
+        elif "1month" in profile_name_lower or "monthly" in profile_name_lower:
+            return 25000
+        return 1000
+
     def _determine_password(
         self, password_type: str, voucher_code: str
     ) -> Optional[str]:
@@ -737,7 +891,37 @@ class VoucherService:
         profile_info = self.db.get_profile(result["profile_name"])
         price = profile_info.get("price", 1000) if profile_info else 1000
 
-        voucher_info = {
+        voucher_info = self._build_voucher_info(result, usage, price)
+
+        return True, voucher_info, "Voucher found"
+
+    def get_vouchers_info_bulk(self, voucher_codes: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        get_voucher_info for many codes with one DB query, one RouterOS call
+        and one profile lookup. Invalid or unknown codes are left out.
+        """
+        codes = [code for code in voucher_codes if validate_voucher_code(code)[0]]
+        rows = self.db.get_vouchers(codes)
+        if not rows:
+            return {}
+
+        usage = self.mikrotik.get_bulk_user_usage(list(rows))
+        profiles = self.db.get_profiles_by_names(
+            list({row["profile_name"] for row in rows.values()})
+        )
+
+        voucher_infos = {}
+        for code, row in rows.items():
+            profile_info = profiles.get(row["profile_name"])
+            price = profile_info.get("price", 1000) if profile_info else 1000
+            voucher_infos[code] = self._build_voucher_info(row, usage.get(code), price)
+        return voucher_infos
+
+    @staticmethod
+    def _build_voucher_info(
+        result: Dict[str, Any], usage: Optional[Dict[str, Any]], price: int
+    ) -> Dict[str, Any]:
+        return {
             "code": result["voucher_code"],
             "profile_name": result["profile_name"],
             "created_at": result["created_at"],
@@ -753,8 +937,6 @@ class VoucherService:
             "price": price,
         }
 
-        return True, voucher_info, "Voucher found"
-
     def get_expired_vouchers(self) -> List[Dict[str, Any]]:
         """Get vouchers that have reached their uptime limit"""
         rows = (
@@ -771,13 +953,17 @@ class VoucherService:
             or []
         )
 
+        # Get current usage from MikroTik for the whole page at once
+        usages = self.mikrotik.get_bulk_user_usage(
+            [row["voucher_code"] for row in rows]
+        )
+
         expired_vouchers = []
         for row in rows:
             voucher_code = row["voucher_code"]
             uptime_limit = row["uptime_limit"]
 
-            # Get current usage from MikroTik
-            usage = self.mikrotik.get_user_usage(voucher_code)
+            usage = usages.get(voucher_code)
             current_uptime = usage.get("uptime", "0s") if usage else "0s"
 
             # Check if uptime limit is reached
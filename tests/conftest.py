@@ -0,0 +1,16 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# services.auth_service refuses to import without these
+for _var in (
+    "APP_SECRET_KEY",
+    "JWT_SECRET_KEY",
+    "ENCRYPTION_KEY",
+    "TWILIO_SID",
+    "TWILIO_AUTH_TOKEN",
+    "TWILIO_PHONE_NUMBER",
+):
+    os.environ.setdefault(_var, f"test-{_var.lower()}-".ljust(40, "x"))
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
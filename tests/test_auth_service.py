@@ -0,0 +1,114 @@
+import pytest
+from flask import Flask, g, jsonify
+
+from services import auth_service
+from services.auth_service import AuthService
+
+USER_ID = "usr_1700000000_4242"
+EMAIL = "owner@example.com"
+
+
+class FakeDatabase:
+    """Just enough of DatabaseService for login, secured() and password reset"""
+
+    def __init__(self, password: str):
+        self.user = {
+            "id": USER_ID,
+            "email": EMAIL,
+            "full_name": "Owner",
+            "role": "user",
+            "company_name": "",
+            "is_active": True,
+            "is_verified": True,
+            "password": AuthService.hash_password(password),
+        }
+        self.sessions = {}  # token -> user_id
+
+    def verify_login(self, credentials):
+        return dict(self.user) if credentials["email"] == EMAIL else None
+
+    def create_session(self, user_id, token, device_info=None, ip_address=None):
+        self.sessions[token] = user_id
+        return True
+
+    def validate_session(self, token):
+        user_id = self.sessions.get(token)
+        return {"user_id": user_id} if user_id else None
+
+    def validate_password_reset_token(self, token):
+        if token != "reset-token":
+            return None
+        return {"id": 1, "token": token, "user_id": USER_ID, "email": EMAIL}
+
+    def update_user_password(self, user_id, hashed_password):
+        self.user["password"] = hashed_password
+        return True
+
+    def use_password_reset_token(self, token):
+        return True
+
+    def invalidate_all_user_sessions(self, user_id):
+        self.sessions = {t: u for t, u in self.sessions.items() if u != user_id}
+        return True
+
+
+@pytest.fixture
+def db():
+    auth_service._token_cache.clear()
+    return FakeDatabase("OldPassw0rd")
+
+
+@pytest.fixture
+def app(db):
+    app = Flask(__name__)
+    app.extensions["db"] = db
+
+    @app.route("/me")
+    @AuthService.secured()
+    def me():
+        return jsonify({"uid": g.uid})
+
+    return app
+
+
+def login(app, db, password):
+    with app.test_request_context():
+        response = AuthService.login_user(db, EMAIL, password)
+        return response.get_json()["data"]["token"]
+
+
+def test_cached_token_is_accepted(app, db):
+    token = login(app, db, "OldPassw0rd")
+    client = app.test_client()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    assert client.get("/me", headers=headers).get_json() == {"uid": USER_ID}
+    # Served from the verification cache this time
+    assert client.get("/me", headers=headers).status_code == 200
+
+
+def test_password_reset_revokes_cached_token(app, db):
+    token = login(app, db, "OldPassw0rd")
+    client = app.test_client()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    # Populates the verification cache for this token
+    assert client.get("/me", headers=headers).status_code == 200
+
+    with app.test_request_context():
+        AuthService.reset_password(db, "reset-token", "NewPassw0rd")
+
+    assert client.get("/me", headers=headers).status_code == 401
+
+
+def test_logout_revokes_cached_token(app, db):
+    token = login(app, db, "OldPassw0rd")
+    client = app.test_client()
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/me", headers=headers).status_code == 200
+
+    db.invalidate_session = lambda t: db.sessions.pop(t, None) is not None
+    with app.test_request_context():
+        AuthService.logout_user(db, token)
+
+    assert client.get("/me", headers=headers).status_code == 401
@@ -0,0 +1,80 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+import routeros_api
+
+from services import mikrotik_manager
+from services.mikrotik_manager import MikroTikManager
+
+CONFIG = SimpleNamespace(
+    MIKROTIK_CONFIG={"host": "10.0.0.1", "username": "admin", "password": "secret"}
+)
+
+
+class FakeRouterOsApiPool:
+    """Stands in for routeros_api.RouterOsApiPool; every instance is one login"""
+
+    logins = []
+
+    def __init__(self, host, **kwargs):
+        self.closed = False
+        self.dead = False
+        FakeRouterOsApiPool.logins.append(self)
+
+    def get_api(self):
+        return self
+
+    def get_resource(self, path):
+        if self.dead:
+            raise routeros_api.exceptions.RouterOsApiConnectionClosedError("closed")
+        return SimpleNamespace(get=lambda **kwargs: [{"name": "router"}])
+
+    def disconnect(self):
+        self.closed = True
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    FakeRouterOsApiPool.logins = []
+    monkeypatch.setattr(routeros_api, "RouterOsApiPool", FakeRouterOsApiPool)
+    return MikroTikManager(CONFIG)
+
+
+def test_idle_session_is_reused(manager):
+    manager.get_profiles()
+    manager.get_profiles()
+    assert len(FakeRouterOsApiPool.logins) == 1
+
+
+def test_dead_reused_session_is_retried_on_fresh_login(manager):
+    manager.get_profiles()
+    stale = FakeRouterOsApiPool.logins[0]
+    stale.dead = True
+
+    assert manager.get_profiles() == [{"name": "router"}]
+    assert len(FakeRouterOsApiPool.logins) == 2
+    assert stale.closed
+
+
+def test_failure_on_fresh_login_is_not_retried(manager, monkeypatch):
+    def unreachable(self, path):
+        raise routeros_api.exceptions.RouterOsApiConnectionError("timed out")
+
+    monkeypatch.setattr(FakeRouterOsApiPool, "get_resource", unreachable)
+
+    assert manager.get_profiles() == []
+    assert len(FakeRouterOsApiPool.logins) == 1
+    assert FakeRouterOsApiPool.logins[0].closed
+
+
+def test_sweep_closes_expired_idle_sessions(manager, monkeypatch):
+    manager.get_profiles()
+    session = FakeRouterOsApiPool.logins[0]
+
+    later = time.monotonic() + mikrotik_manager.POOL_IDLE_TTL + 1
+    monkeypatch.setattr(mikrotik_manager.time, "monotonic", lambda: later)
+    manager.sweep_idle()
+
+    assert session.closed
+    assert manager._pool == {}
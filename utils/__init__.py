@@ -5,7 +5,12 @@ from .helpers import (
     uptime_limit_to_seconds,
     check_uptime_limit,
     calculate_expiry_time,
-    format_bytes
+    format_bytes,
+    dumps_json,
+    etag_json,
+    cached_response,
+    OrjsonProvider,
+    ORJSON_AVAILABLE
 )
 
 from .validators import (
@@ -22,6 +27,11 @@ __all__ = [
     'check_uptime_limit',
     'calculate_expiry_time',
     'format_bytes',
+    'dumps_json',
+    'etag_json',
+    'cached_response',
+    'OrjsonProvider',
+    'ORJSON_AVAILABLE',
     'validate_voucher_code',
     'validate_profile_name',
     'validate_quantity',
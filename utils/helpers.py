@@ -1,12 +1,146 @@
 import random
 import string
 import logging
-from datetime import datetime, timedelta
-from typing import Optional
+import json
+import uuid
+import decimal
+import dataclasses
+import hashlib
+import threading
+from functools import wraps
+from datetime import date, datetime, timedelta
+from typing import Any, Optional
 import re
 
+from cachetools import LRUCache, TTLCache
+from flask import Response, make_response, request
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
 logger = logging.getLogger(__name__)
 
+try:
+    import orjson
+
+    ORJSON_AVAILABLE = True
+    # Dates go through _json_default so the wire format matches jsonify
+    _ORJSON_OPTIONS = (
+        orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+    )
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def _json_default(obj: Any) -> Any:
+    """Serialize the same extra types as Flask's default JSON provider"""
+    if isinstance(obj, date):
+        return http_date(obj)
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, "__html__"):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_json(obj: Any) -> bytes:
+    """Encode obj to compact JSON bytes, using orjson when available"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, default=_json_default, option=_ORJSON_OPTIONS)
+    return json.dumps(
+        obj, default=_json_default, sort_keys=True, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def etag_json(obj: Any, max_age: int = 30) -> Response:
+    """JSON response with a weak ETag; answers 304 when the client's copy is current"""
+    body = dumps_json(obj)
+    tag = hashlib.blake2b(body, digest_size=8).hexdigest()
+    headers = {
+        "ETag": f'W/"{tag}"',
+        "Cache-Control": f"private, max-age={max_age}",
+    }
+    if request.if_none_match.contains_weak(tag):
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype="application/json", headers=headers)
+
+
+def cached_response(ttl: int, maxsize: int = 64):
+    """
+    Cache a GET handler's successful response per path + query string for ttl
+    seconds. If the handler later fails (e.g. the router is unreachable), the
+    last good response for that key is served instead of the error.
+    """
+
+    def decorator(fn):
+        fresh = TTLCache(maxsize=maxsize, ttl=ttl)
+        last_good = LRUCache(maxsize=maxsize)
+        lock = threading.Lock()
+
+        def store(key, entry):
+            with lock:
+                fresh[key] = entry
+                last_good[key] = entry
+
+        def tee(chunks, key, content_type):
+            body = []
+            for chunk in chunks:
+                body.append(chunk)
+                yield chunk
+            store(key, (b"".join(body), content_type))
+
+        def replay(entry):
+            body, content_type = entry
+            return Response(body, status=200, content_type=content_type)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = request.full_path
+            with lock:
+                entry = fresh.get(key)
+            if entry is not None:
+                return replay(entry)
+
+            try:
+                response = make_response(fn(*args, **kwargs))
+            except Exception:
+                with lock:
+                    entry = last_good.get(key)
+                if entry is None:
+                    raise
+                logger.warning(f"Serving stale response for {key}", exc_info=True)
+                return replay(entry)
+
+            if response.status_code == 200 and response.is_streamed:
+                # Pass chunks through as they are produced; cache once complete
+                response.response = tee(response.response, key, response.content_type)
+            elif response.status_code == 200:
+                store(key, (response.get_data(), response.content_type))
+            elif response.status_code >= 500:
+                with lock:
+                    entry = last_good.get(key)
+                if entry is not None:
+                    logger.warning(f"Serving stale response for {key}")
+                    return replay(entry)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider that parses and encodes with orjson"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return dumps_json(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        if ORJSON_AVAILABLE:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
 def generate_voucher_code(length: int, chars: str) -> str:
     """Generate a random voucher code"""
     return ''.join(random.choice(chars) for _ in range(length))